@@ -0,0 +1,77 @@
+"""Account data export as newline-delimited JSON.
+
+Every record is one line, {"type": ..., **fields}, read through
+QuerySet.iterator() in chunks so memory stays flat however large the account.
+Under ASGI the lines are streamed through aexport_lines() instead, Django
+would read a sync iterator into memory before sending it.
+"""
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+
+from notifications.models import Notification
+from posts.models import Comment, Like, Post
+from social_media_api.snowflake import render_id
+from .models import CustomUser
+
+CHUNK_SIZE = 2000
+
+Follow = CustomUser.following.through
+
+# snowflake id columns per record type, rendered as the API renders them
+SNOWFLAKE_COLUMNS = {
+    'post': ('id',),
+    'comment': ('id', 'post_id', 'parent_id'),
+    'like': ('post_id',),
+    'notification': ('id',),
+}
+
+
+def export_sections(user):
+    """(type, values queryset) pairs making up one user's export."""
+    return [
+        ('profile', CustomUser.objects.filter(pk=user.pk).values(
+            'id', 'username', 'email', 'first_name', 'last_name', 'bio', 'profile_picture', 'date_joined',
+        )),
+        ('post', Post.objects.filter(author=user).order_by('id').values(
+            'id', 'title', 'content', 'created_at', 'updated_at',
+        )),
+        ('comment', Comment.objects.filter(author=user).order_by('id').values(
+            'id', 'post_id', 'parent_id', 'content', 'created_at', 'updated_at',
+        )),
+        # ordered by a selected column, so the rows of several post shards can be merged
+        ('like', Like.objects.filter(user=user).order_by('post_id').values('post_id', 'created_at')),
+        ('notification', Notification.objects.filter(recipient=user).order_by('id').values(
+            'id', 'actor_id', 'verb', 'target_object_id', 'timestamp', 'is_read',
+            target_type=Concat('target_content_type__app_label', Value('.'), 'target_content_type__model'),
+        )),
+        ('following', Follow.objects.filter(from_customuser=user).order_by('id').values(
+            user_id=F('to_customuser_id'),
+        )),
+        ('follower', Follow.objects.filter(to_customuser=user).order_by('id').values(
+            user_id=F('from_customuser_id'),
+        )),
+    ]
+
+
+def export_lines(user, chunk_size=CHUNK_SIZE):
+    """Yield the user's export one NDJSON line at a time."""
+    encoder = DjangoJSONEncoder()
+    for record_type, rows in export_sections(user):
+        columns = SNOWFLAKE_COLUMNS.get(record_type, ())
+        for row in rows.iterator(chunk_size=chunk_size):
+            for column in columns:
+                row[column] = render_id(row[column])
+            yield encoder.encode({'type': record_type, **row}) + '\n'
+
+
+async def aexport_lines(user, chunk_size=CHUNK_SIZE):
+    """export_lines() as an async iterator, up to chunk_size lines read per thread hop."""
+    lines = export_lines(user, chunk_size)
+    # thread sensitive, so every chunk of the open cursor is read on the same thread
+    read = sync_to_async(lambda: list(islice(lines, chunk_size)))
+    while chunk := await read():
+        yield ''.join(chunk)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.export import CHUNK_SIZE, export_lines
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Write a user's data export as newline-delimited JSON, to stdout or --output."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', help="File to write instead of stdout.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['username'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+
+        lines = export_lines(user, chunk_size=options['chunk_size'])
+        if options['output'] is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            output.writelines(lines)
+        self.stderr.write(self.style.SUCCESS(f"Exported {user.username} to {options['output']}."))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_followers(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    for user in CustomUser.objects.annotate(n=Count('followers')).filter(n__gt=0):
+        CustomUser.objects.filter(pk=user.pk).update(follower_count=user.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_remove_customuser_followers_customuser_following'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
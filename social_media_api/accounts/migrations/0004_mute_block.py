@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_follower_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='blocked',
+            field=models.ManyToManyField(blank=True, related_name='blocked_by', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='muted',
+            field=models.ManyToManyField(blank=True, related_name='muted_by', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
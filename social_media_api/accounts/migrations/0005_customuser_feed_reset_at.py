@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_mute_block'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='feed_reset_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
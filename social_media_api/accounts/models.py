@@ -5,6 +5,13 @@ class CustomUser(AbstractUser):
     bio = models.TextField()
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
     following = models.ManyToManyField('self', symmetrical=False, related_name='followers', blank=True)
+    # hidden from this user's feed and listings, see accounts.restrictions
+    muted = models.ManyToManyField('self', symmetrical=False, related_name='muted_by', blank=True)
+    blocked = models.ManyToManyField('self', symmetrical=False, related_name='blocked_by', blank=True)
+    # denormalized so the feed can tell high-follower authors apart without counting
+    follower_count = models.PositiveIntegerField(default=0)
+    # last follow, which adds older posts a feed delta can't carry; earlier cursors reload the feed
+    feed_reset_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.username
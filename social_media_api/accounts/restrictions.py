@@ -0,0 +1,81 @@
+"""Mute and block lists, mirrored per viewer into a cached sorted id array.
+
+Content listings filter a fetched page against the array in one vectorized
+pass instead of adding a NOT IN (subquery) to every query. A viewer doesn't
+see users they muted, users they blocked or users who blocked them.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from social_media_api.replicas import primary_reads
+
+from .models import CustomUser
+
+Mute = CustomUser.muted.through
+Block = CustomUser.blocked.through
+
+NO_IDS = np.empty(0, dtype=np.int64)
+
+
+def _cache_key(user_id):
+    return f'hidden-authors:{user_id}'
+
+
+def _hidden_rows(user):
+    return (
+        Mute.objects.filter(from_customuser_id=user.id).values_list('to_customuser_id', flat=True)
+        .union(
+            Block.objects.filter(from_customuser_id=user.id).values_list('to_customuser_id', flat=True),
+            Block.objects.filter(to_customuser_id=user.id).values_list('from_customuser_id', flat=True),
+        )
+    )
+
+
+def _as_array(ids):
+    return np.unique(np.fromiter(ids, dtype=np.int64))
+
+
+def hidden_author_ids(user):
+    """Sorted array of the user ids whose content the viewer doesn't see."""
+    if not user.is_authenticated:
+        return NO_IDS
+    ids = cache.get(_cache_key(user.id))
+    if ids is None:
+        # cached until the lists change, so read from the primary
+        with primary_reads():
+            ids = _as_array(list(_hidden_rows(user)))
+        cache.set(_cache_key(user.id), ids, settings.HIDDEN_AUTHORS_CACHE_TIMEOUT)
+    return ids
+
+
+async def ahidden_author_ids(user):
+    if not user.is_authenticated:
+        return NO_IDS
+    ids = await cache.aget(_cache_key(user.id))
+    if ids is None:
+        with primary_reads():
+            ids = _as_array([pk async for pk in _hidden_rows(user)])
+        await cache.aset(_cache_key(user.id), ids, settings.HIDDEN_AUTHORS_CACHE_TIMEOUT)
+    return ids
+
+
+def hidden_mask(author_ids, hidden):
+    """Boolean array, True where an author is in the sorted hidden array."""
+    authors = np.asarray(author_ids, dtype=np.int64)
+    if not len(hidden) or not len(authors):
+        return np.zeros(len(authors), dtype=bool)
+    positions = np.minimum(np.searchsorted(hidden, authors), len(hidden) - 1)
+    return hidden[positions] == authors
+
+
+def visible(items, hidden, author_id):
+    """items without those whose author_id(item) is hidden, order kept."""
+    if not len(hidden) or not items:
+        return items
+    mask = hidden_mask([author_id(item) for item in items], hidden)
+    return [item for item, hide in zip(items, mask) if not hide]
+
+
+def invalidate_hidden_authors(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
@@ -1,3 +1,109 @@
-from django.test import TestCase
+import json
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import AsyncClient
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from notifications.models import Notification
+from .models import CustomUser
+from .views import AsyncFollowersListView, AsyncFollowingListView
+
+
+class FollowListTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.client.force_authenticate(self.bob)
+        self.client.post(f"/accounts/follow/{self.alice.id}/")
+
+    def test_followers_prefetch_following_ids(self):
+        # the target user, the followers page and one prefetch of their following lists
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/accounts/users/{self.alice.id}/followers/")
+        self.assertEqual(response.data[0]["following"], [self.alice.id])
+
+    def test_sparse_fields_skip_the_following_prefetch(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/accounts/users/{self.alice.id}/followers/", {"fields": "id,username"})
+        self.assertEqual(response.data, [{"id": self.bob.id, "username": "bob"}])
+
+
+    def test_async_lists_match_the_sync_ones(self):
+        token = Token.objects.create(user=self.bob)
+        for view, path in (
+            (AsyncFollowersListView, f"/accounts/users/{self.alice.id}/followers/"),
+            (AsyncFollowingListView, f"/accounts/users/{self.bob.id}/following/"),
+        ):
+            for params in ({}, {"fields": "id,username"}):
+                request = APIRequestFactory().get(path, params, HTTP_AUTHORIZATION=f"Token {token.key}")
+                user_id = int(path.split("/")[3])
+                response = async_to_sync(view.as_view())(request, user_id=user_id)
+                self.assertEqual(json.loads(response.content), self.client.get(path, params).json())
+
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        response = async_to_sync(AsyncFollowersListView.as_view())(request, user_id=0)
+        self.assertEqual(response.status_code, 404)
+
+
+class IdempotentFollowTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password=None)
+        self.bob = CustomUser.objects.create_user(username="bob", password=None)
+        self.client.force_authenticate(self.alice)
+
+    def test_retried_follow_is_replayed(self):
+        for _ in range(2):
+            response = self.client.post(f"/accounts/follow/{self.bob.id}/", HTTP_IDEMPOTENCY_KEY="f1")
+            self.assertEqual(response.data, {"detail": "You are now following bob."})
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.follower_count, 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.bob).count(), 1)
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/follow/{self.bob.id}/")
+        post_id = self.client.post("/api/posts/", {"title": "Hi", "content": "Hello"}).data["id"]
+        self.client.post("/api/comments/", {"post": post_id, "content": "Me again"})
+        self.client.force_authenticate(self.bob)
+        self.client.post(f"/api/posts/{post_id}/like/")
+        self.client.force_authenticate(self.alice)
+
+    def test_export_streams_one_record_per_line(self):
+        response = self.client.get("/accounts/export/")
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            [record["type"] for record in records],
+            ["profile", "post", "comment", "notification", "following"],
+        )
+        self.assertEqual(records[3]["target_type"], "posts.post")
+        self.assertEqual(records[4]["user_id"], self.bob.id)
+
+    def test_export_streams_asynchronously_under_asgi(self):
+        expected = b"".join(self.client.get("/accounts/export/").streaming_content)
+        token = Token.objects.create(user=self.alice)
+
+        async def export():
+            response = await AsyncClient().get("/accounts/export/", headers={"Authorization": f"Token {token.key}"})
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(async_to_sync(export)(), expected)
+
+    def test_command_matches_the_endpoint(self):
+        out = StringIO()
+        call_command("export_account", "alice", chunk_size=1, stdout=out)
+        response = self.client.get("/accounts/export/")
+        self.assertEqual(out.getvalue().encode(), b"".join(response.streaming_content))
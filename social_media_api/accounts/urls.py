@@ -1,15 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
-    RegisterView, LoginView, ProfileView, FollowUserView, 
-    UnfollowUserView, FollowersListView, FollowingListView
+    RegisterView, LoginView, ProfileView, ExportView, FollowUserView, 
+    UnfollowUserView, FollowersListView, FollowingListView,
+    MuteUserView, UnmuteUserView, BlockUserView, UnblockUserView,
+    AsyncFollowersListView, AsyncFollowingListView,
     )
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('profile/', ProfileView.as_view(), name='profile'),
+    path('export/', ExportView.as_view(), name='export'),
     path("follow/<int:user_id>/", FollowUserView.as_view()),
     path("unfollow/<int:user_id>/", UnfollowUserView.as_view()),
-    path("users/<int:user_id>/followers/", FollowersListView.as_view()),
-    path("users/<int:user_id>/following/", FollowingListView.as_view()),
+    path("mute/<int:user_id>/", MuteUserView.as_view()),
+    path("unmute/<int:user_id>/", UnmuteUserView.as_view()),
+    path("block/<int:user_id>/", BlockUserView.as_view()),
+    path("unblock/<int:user_id>/", UnblockUserView.as_view()),
+    path("users/<int:user_id>/followers/", (
+        AsyncFollowersListView if settings.ASYNC_VIEWS else FollowersListView
+    ).as_view()),
+    path("users/<int:user_id>/following/", (
+        AsyncFollowingListView if settings.ASYNC_VIEWS else FollowingListView
+    ).as_view()),
 ]
@@ -3,12 +3,26 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.authtoken.models import Token
 
-from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils import timezone
 
 from .serializers import RegisterSerializer, LoginSerializer, UserSerializer
 from .models import CustomUser
+from .export import CHUNK_SIZE, aexport_lines, export_lines
+from .restrictions import invalidate_hidden_authors
 
 from notifications.utils import create_notification
+from posts.feed_cache import bump_feed_versions
+from posts.timeline import backfill_timeline, trim_timeline
+from social_media_api.async_views import AsyncAPIView
+from social_media_api.fieldsets import is_field_selected, narrow_queryset
+from social_media_api.idempotency import idempotent
+
+Follow = CustomUser.following.through
 
 
 class RegisterView(APIView):
@@ -45,12 +59,24 @@ class ProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        return Response(UserSerializer(request.user).data)
+        return Response(UserSerializer(request.user, context={'request': request}).data)
     
 
+class ExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        # each server streams its own kind of iterator without buffering it first
+        lines = aexport_lines if isinstance(request._request, ASGIRequest) else export_lines
+        response = StreamingHttpResponse(lines(request.user), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{request.user.username}-export.ndjson"'
+        return response
+
+
 class FollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, user_id):
         target = get_object_or_404(CustomUser, id=user_id)
         user = request.user
@@ -58,10 +84,17 @@ class FollowUserView(APIView):
         if user == target:
             return Response({"detail": "You cannot follow yourself."}, status=400)
 
-        if target in user.following.all():
+        with transaction.atomic():
+            # counted only by the request whose insert went in, a concurrent follow finds the row
+            _, created = Follow.objects.get_or_create(from_customuser_id=user.id, to_customuser_id=target.id)
+            if created:
+                CustomUser.objects.filter(pk=target.pk).update(follower_count=F('follower_count') + 1)
+        if not created:
             return Response({"detail": "Already following this user."}, status=400)
 
-        user.following.add(target)
+        backfill_timeline(user, target)
+        CustomUser.objects.filter(pk=user.pk).update(feed_reset_at=timezone.now())
+        bump_feed_versions([user.id])
         create_notification(
             recipient=target,
             actor=user,
@@ -80,21 +113,78 @@ class UnfollowUserView(APIView):
         target = get_object_or_404(CustomUser, id=user_id)
         user = request.user
 
-        if target not in user.following.all():
+        with transaction.atomic():
+            removed, _ = Follow.objects.filter(from_customuser_id=user.id, to_customuser_id=target.id).delete()
+            if removed:
+                CustomUser.objects.filter(pk=target.pk).update(follower_count=F('follower_count') - 1)
+        if not removed:
             return Response({"detail": "You are not following this user."}, status=400)
 
-        user.following.remove(target)
+        trim_timeline(user, target)
+        bump_feed_versions([user.id])
         return Response({"detail": f"Unfollowed {target.username}."}, status=200)
 
 
+class RestrictUserView(APIView):
+    """Adds or removes target in one of the user's mute/block lists."""
+    permission_classes = [permissions.IsAuthenticated]
+    relation = None
+    add = True
+    verb = None
+    done = None
+
+    def post(self, request, user_id):
+        target = get_object_or_404(CustomUser, id=user_id)
+        user = request.user
+
+        if user == target:
+            return Response({"detail": f"You cannot {self.verb} yourself."}, status=400)
+
+        related = getattr(user, self.relation)
+        if self.add:
+            related.add(target)
+        else:
+            related.remove(target)
+        # a block hides content both ways, so both users' lists and feeds change
+        invalidate_hidden_authors([user.id, target.id])
+        bump_feed_versions([user.id, target.id])
+        return Response({"detail": f"{self.done} {target.username}."}, status=200)
+
+
+class MuteUserView(RestrictUserView):
+    relation, add, verb, done = 'muted', True, 'mute', 'Muted'
+
+
+class UnmuteUserView(RestrictUserView):
+    relation, add, verb, done = 'muted', False, 'unmute', 'Unmuted'
+
+
+class BlockUserView(RestrictUserView):
+    relation, add, verb, done = 'blocked', True, 'block', 'Blocked'
+
+
+class UnblockUserView(RestrictUserView):
+    relation, add, verb, done = 'blocked', False, 'unblock', 'Unblocked'
+
+
+def user_list(request, users):
+    context = {'request': request}
+    if is_field_selected(request, 'following'):
+        users = users.prefetch_related('following')
+    return narrow_queryset(users, UserSerializer(context=context)), context
+
+
+def user_list_data(request, users):
+    users, context = user_list(request, users)
+    return UserSerializer(users, many=True, context=context).data
+
+
 class FollowersListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, user_id):
         user = get_object_or_404(CustomUser, id=user_id)
-        followers = user.followers.all()
-        serializer = UserSerializer(followers, many=True)
-        return Response(serializer.data)
+        return Response(user_list_data(request, user.followers.all()))
 
 
 class FollowingListView(APIView):
@@ -102,9 +192,21 @@ class FollowingListView(APIView):
 
     def get(self, request, user_id):
         user = get_object_or_404(CustomUser, id=user_id)
-        following = user.following.all()
-        serializer = UserSerializer(following, many=True)
-        return Response(serializer.data)
+        return Response(user_list_data(request, user.following.all()))
+
+
+class AsyncFollowersListView(AsyncAPIView):
+    relation = 'followers'
+
+    async def get(self, request, user_id):
+        user = await aget_object_or_404(CustomUser, id=user_id)
+        users, context = user_list(request, getattr(user, self.relation).all())
+        users = [u async for u in users.aiterator(chunk_size=CHUNK_SIZE)]
+        return Response(UserSerializer(users, many=True, context=context).data)
+
+
+class AsyncFollowingListView(AsyncFollowersListView):
+    relation = 'following'
 
 # accounts/views.py doesn't contain: ["generics.GenericAPIView", "CustomUser.objects.all()"], but i don't like generics.GenericAPIView
 
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='target_object_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
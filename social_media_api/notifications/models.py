@@ -3,14 +3,17 @@ from accounts.models import CustomUser
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
+from social_media_api.snowflake import SnowflakeModel
 
-class Notification(models.Model):
+
+class Notification(SnowflakeModel):
     recipient = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
     actor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='actions')    
     verb = models.CharField(max_length=255)
 
     target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    target_object_id = models.PositiveIntegerField()
+    # wide enough for snowflake ids of posts, comments and likes
+    target_object_id = models.PositiveBigIntegerField()
     target = GenericForeignKey('target_content_type', 'target_object_id')
 
     timestamp = models.DateTimeField(auto_now_add=True)
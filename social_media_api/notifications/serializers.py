@@ -1,7 +1,10 @@
 from rest_framework import serializers
+
+from social_media_api.fieldsets import SparseFieldsetMixin
+from social_media_api.snowflake import SnowflakeIdsMixin
 from .models import Notification
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(SnowflakeIdsMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     actor = serializers.StringRelatedField()
     target = serializers.StringRelatedField()
 
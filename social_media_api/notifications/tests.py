@@ -1,3 +1,51 @@
-from django.test import TestCase
+import json
+
+from asgiref.sync import async_to_sync
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from accounts.models import CustomUser
+from posts.models import Post
+from .views import AsyncNotificationListView
+
+
+class NotificationListTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.post = Post.objects.create(author=self.alice, title="Hello", content="Body")
+        self.client.force_authenticate(self.bob)
+        self.client.post(f"/api/posts/{self.post.id}/like/")
+        self.client.post(f"/accounts/follow/{self.alice.id}/")
+        self.client.force_authenticate(self.alice)
+
+    def test_list_renders_actor_and_target(self):
+        response = self.client.get("/notification/")
+        self.assertEqual(
+            [(n["actor"], n["verb"], n["target"]) for n in response.data],
+            [("bob", "started following you", "alice"), ("bob", "liked your post", "Hello by alice")],
+        )
+
+    def test_sparse_fields(self):
+        response = self.client.get("/notification/", {"fields": "verb,is_read"})
+        self.assertEqual(response.data[0], {"verb": "started following you", "is_read": False})
+
+    def test_targets_are_loaded_without_a_query_each(self):
+        self.client.force_authenticate(self.bob)
+        for i in range(3):
+            post = Post.objects.create(author=self.bob, title=f"Post {i}", content="Body")
+            self.client.post("/api/comments/", {"post": post.id, "content": f"@alice look {i}"})
+        self.client.force_authenticate(self.alice)
+        # notifications with their actors, then targets per content type with authors and posts
+        with self.assertNumQueries(4):
+            response = self.client.get("/notification/")
+        self.assertEqual(len(response.data), 5)
+
+    def test_async_list_matches_the_sync_one(self):
+        token = Token.objects.create(user=self.alice)
+        for params in ({}, {"fields": "verb,target"}):
+            request = APIRequestFactory().get("/notification/", params, HTTP_AUTHORIZATION=f"Token {token.key}")
+            response = async_to_sync(AsyncNotificationListView.as_view())(request)
+            self.assertEqual(json.loads(response.content), self.client.get("/notification/", params).json())
 
-# Create your tests here.
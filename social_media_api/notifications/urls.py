@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import path
-from .views import NotificationListView, MarkNotificationReadView
+from .views import AsyncNotificationListView, NotificationListView, MarkNotificationReadView
 
 urlpatterns = [
-    path('', NotificationListView.as_view()),
+    path('', (AsyncNotificationListView if settings.ASYNC_VIEWS else NotificationListView).as_view()),
     path('<int:pk>/read/', MarkNotificationReadView.as_view()),
 ]
@@ -9,3 +9,18 @@ def create_notification(*, recipient, actor, verb, target):
         target_content_type=ContentType.objects.get_for_model(target),
         target_object_id=target.id
     )
+
+
+def create_notifications(*, actor, verb, targets):
+    """One notification per (recipient_id, target) pair, in a single INSERT."""
+    Notification.objects.bulk_create([
+        Notification(
+            recipient_id=recipient_id,
+            actor=actor,
+            verb=verb,
+            # get_for_model() is cached after the first lookup
+            target_content_type=ContentType.objects.get_for_model(target),
+            target_object_id=target.id
+        )
+        for recipient_id, target in targets
+    ])
@@ -3,20 +3,49 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+
+from posts.models import Comment, Post
+from social_media_api.async_views import AsyncAPIView
+from social_media_api.fieldsets import is_field_selected, is_sparse, narrow_queryset
 from .models import Notification
 from .serializers import NotificationSerializer
 
+# aiterator() only prefetches when given a chunk size
+CHUNK_SIZE = 2000
+
+
+def notification_list(request):
+    notifications = Notification.objects.filter(recipient=request.user).order_by('is_read', '-timestamp')
+    context = {'request': request}
+    if not is_sparse(request):
+        notifications = notifications.select_related('actor')
+    if is_field_selected(request, 'target'):
+        # targets render through __str__, which reads their author and post
+        notifications = notifications.prefetch_related(GenericPrefetch('target', [
+            Post.objects.select_related('author'),
+            Comment.objects.select_related('author', 'post'),
+        ]))
+    return narrow_queryset(notifications, NotificationSerializer(context=context)), context
+
 
 class NotificationListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        notifications = Notification.objects.filter(recipient=request.user).order_by('is_read', '-timestamp')
-
-        serializer = NotificationSerializer(notifications, many=True)
+        notifications, context = notification_list(request)
+        serializer = NotificationSerializer(notifications, many=True, context=context)
         return Response(serializer.data)
 
 
+class AsyncNotificationListView(AsyncAPIView):
+
+    async def get(self, request):
+        notifications, context = notification_list(request)
+        notifications = [n async for n in notifications.aiterator(chunk_size=CHUNK_SIZE)]
+        return Response(NotificationSerializer(notifications, many=True, context=context).data)
+
+
 class MarkNotificationReadView(APIView):
     permission_classes = [IsAuthenticated]
 
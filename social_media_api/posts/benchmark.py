@@ -0,0 +1,31 @@
+"""ASGI app for the benchmark_async_views command, with a slow database.
+
+Every query sleeps BENCHMARK_QUERY_LATENCY seconds first, standing in for
+a database across the network. That keeps the requests slow inside the
+app, which is where sync and async views differ; slow clients alone don't,
+uvicorn reads the whole request before Django sees it.
+"""
+import os
+import time
+
+from django.core.asgi import get_asgi_application
+from django.db.backends.signals import connection_created
+
+LATENCY_ENV = 'BENCHMARK_QUERY_LATENCY'
+
+
+def application():
+    """uvicorn --factory entry point."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social_media_api.settings')
+    asgi_application = get_asgi_application()
+    latency = float(os.environ.get(LATENCY_ENV, 0))
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def add_delay(connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(add_delay, weak=False)
+    return asgi_application
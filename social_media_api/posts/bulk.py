@@ -0,0 +1,24 @@
+from django.db import transaction
+
+from . import feed_cache
+from .mentions import notify_mentions
+from .models import Post
+from .search import index_posts
+from .tags import sync_post_tags
+from .timeline import fan_out_posts
+
+BATCH_SIZE = 500
+
+
+def create_posts(author, items):
+    """Insert validated posts in chunks and run their side effects once for the batch."""
+    posts = [Post(author=author, **item) for item in items]
+    with transaction.atomic():
+        Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+        # bulk_create sends no post_save, so do here what the signals would have
+        index_posts(posts)
+        sync_post_tags(posts, new=True)
+        fan_out_posts(posts)
+        notify_mentions(author, [(post.content, post) for post in posts], "mentioned you in a post")
+    feed_cache.invalidate_author_feeds(author)
+    return posts
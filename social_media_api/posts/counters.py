@@ -0,0 +1,59 @@
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from social_media_api import sharding
+
+from .models import Post, PostCounterShard
+
+
+def add_to_row(model, lookup, using=None, **deltas):
+    """Atomically add deltas to the row matching lookup, creating it if missing."""
+    rows = model.objects.db_manager(using)
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if rows.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic(using=rows.db):
+            rows.create(**lookup, **deltas)
+    except IntegrityError:
+        # another writer created the row first
+        rows.filter(**lookup).update(**updates)
+
+
+def post_database(post_id):
+    """The database holding a post, looked up on every shard if need be."""
+    if not sharding.enabled():
+        return None
+    author_ids = list(Post.objects.filter(pk=post_id).values_list('author_id', flat=True))
+    return sharding.shard_for_author(author_ids[0]) if author_ids else None
+
+
+def change_post_counts(post_id, likes=0, comments=0, using=None):
+    deltas = {
+        field: delta
+        for field, delta in (('like_count', likes), ('comment_count', comments))
+        if delta
+    }
+    if not deltas:
+        return
+
+    if using is None:
+        using = post_database(post_id)
+    shards = settings.POST_COUNTER_SHARDS
+    if shards > 1:
+        add_to_row(
+            PostCounterShard, {'post_id': post_id, 'shard': random.randrange(shards)}, using=using, **deltas
+        )
+    else:
+        Post.objects.db_manager(using).filter(pk=post_id).update(**{
+            field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items()
+        })
+
+
+def post_counts(post_id):
+    """Current (like_total, comment_total) of one post."""
+    return Post.objects.with_counter_totals().values_list('like_total', 'comment_total').get(pk=post_id)
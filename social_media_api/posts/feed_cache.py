@@ -0,0 +1,132 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .timeline import fanout_limit
+
+HITS_KEY = 'feed:stats:hits'
+MISSES_KEY = 'feed:stats:misses'
+BUMP_BATCH_SIZE = 1000
+
+
+def _user_version_key(user_id):
+    return f'feed:version:user:{user_id}'
+
+
+def _author_version_key(author_id):
+    return f'feed:version:author:{author_id}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _version_keys(user_id, celebrities):
+    return [_user_version_key(user_id)] + [_author_version_key(a) for a in sorted(celebrities)]
+
+
+def _combined(keys, versions):
+    joined = ':'.join(versions[key] for key in keys)
+    return hashlib.md5(joined.encode()).hexdigest()
+
+
+def feed_version(user_id, celebrities=()):
+    """Combined version of a user's feed and the high-follower authors pulled into it.
+
+    Versions are random tokens rather than counters, so an evicted version
+    key simply comes back as a new version and can never match a stale page.
+    """
+    keys = _version_keys(user_id, celebrities)
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return _combined(keys, versions)
+
+
+async def afeed_version(user_id, celebrities=()):
+    keys = _version_keys(user_id, celebrities)
+    versions = await cache.aget_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        await cache.aset_many(missing, None)
+        versions.update(missing)
+    return _combined(keys, versions)
+
+
+def bump_feed_versions(user_ids):
+    """Invalidate every cached feed page of the given users."""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BUMP_BATCH_SIZE):
+        batch = user_ids[start:start + BUMP_BATCH_SIZE]
+        cache.set_many({_user_version_key(user_id): _new_version() for user_id in batch}, None)
+
+
+def invalidate_author_feeds(author):
+    """Invalidate the feeds an author's posts appear in after one of them changed."""
+    if author.follower_count > fanout_limit():
+        # their posts are pulled at read time and keyed on the author's own version
+        cache.set(_author_version_key(author.id), _new_version(), None)
+    else:
+        bump_feed_versions(author.followers.values_list('id', flat=True).iterator())
+
+
+def _page_key(user_id, version, full_path):
+    path_hash = hashlib.md5(full_path.encode()).hexdigest()
+    return f'feed:page:{user_id}:{version}:{path_hash}'
+
+
+def page_key(user_id, full_path, celebrities=()):
+    return _page_key(user_id, feed_version(user_id, celebrities), full_path)
+
+
+async def apage_key(user_id, full_path, celebrities=()):
+    return _page_key(user_id, await afeed_version(user_id, celebrities), full_path)
+
+
+def _count(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+async def _acount(key):
+    await cache.aadd(key, 0, None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, None)
+
+
+def get_page(key):
+    data = cache.get(key)
+    _count(MISSES_KEY if data is None else HITS_KEY)
+    return data
+
+
+async def aget_page(key):
+    data = await cache.aget(key)
+    await _acount(MISSES_KEY if data is None else HITS_KEY)
+    return data
+
+
+def set_page(key, data):
+    cache.set(key, data, settings.FEED_CACHE_TIMEOUT)
+
+
+async def aset_page(key, data):
+    await cache.aset(key, data, settings.FEED_CACHE_TIMEOUT)
+
+
+def stats():
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {
+        'hits': counters.get(HITS_KEY, 0),
+        'misses': counters.get(MISSES_KEY, 0),
+    }
@@ -0,0 +1,95 @@
+"""Feed delta sync: posts changed since a cursor, plus tombstones for removed ones.
+
+The cursor carries the feed version it was issued at (see feed_cache), so a
+poll where nothing changed is answered from the cache after the single
+celebrity_ids() lookup, without touching posts or tombstones.
+
+A follow adds the author's older posts to the feed, which a delta keyed on
+updated_at can't carry; a cursor issued before the user's last follow gets
+410 and the client reloads the feed.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from .models import FeedTombstone
+from .timeline import Follow, timeline_posts
+
+
+class Cursor(NamedTuple):
+    updated_at: datetime
+    post_id: int
+    tombstone_id: int
+    version: str
+    issued_at: datetime
+
+
+def encode_cursor(cursor):
+    payload = {
+        't': cursor.updated_at.isoformat(),
+        'p': cursor.post_id,
+        'd': cursor.tombstone_id,
+        'v': cursor.version,
+        'at': cursor.issued_at.isoformat(),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(encoded):
+    """Cursor from its encoded form, ValueError if it isn't one."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        cursor = Cursor(
+            updated_at=datetime.fromisoformat(payload['t']),
+            post_id=int(payload['p']),
+            tombstone_id=int(payload['d']),
+            version=str(payload['v']),
+            issued_at=datetime.fromisoformat(payload['at']),
+        )
+    except (TypeError, KeyError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor.") from e
+    # encode_cursor() only writes aware times, and naive ones can't be compared with them
+    if timezone.is_naive(cursor.updated_at) or timezone.is_naive(cursor.issued_at):
+        raise ValueError("Invalid cursor.")
+    return cursor
+
+
+def initial_cursor(version):
+    """Cursor for a client that just loaded the whole feed."""
+    now = timezone.now()
+    last = FeedTombstone.objects.order_by('-id').values_list('id', flat=True).first()
+    return Cursor(updated_at=now, post_id=0, tombstone_id=last or 0, version=version, issued_at=now)
+
+
+def is_expired(cursor):
+    """Whether tombstones the cursor still needs may have been pruned already."""
+    retention = timedelta(days=settings.FEED_TOMBSTONE_RETENTION_DAYS)
+    return cursor.issued_at < timezone.now() - retention
+
+
+def followed_since(user, cursor):
+    """Whether the user followed someone after the cursor was issued."""
+    reset_at = CustomUser.objects.filter(pk=user.pk).values_list('feed_reset_at', flat=True).first()
+    return reset_at is not None and cursor.issued_at < reset_at
+
+
+def changed_posts(user, celebrities, cursor):
+    """Feed posts created or edited after the cursor, oldest change first."""
+    since = Q(updated_at__gt=cursor.updated_at) | Q(updated_at=cursor.updated_at, id__gt=cursor.post_id)
+    return timeline_posts(user, celebrities).filter(since).order_by('updated_at', 'id')
+
+
+def tombstones(user, cursor):
+    """Tombstones after the cursor: the user's own unfollows and deletions by followed authors."""
+    followed = Follow.objects.filter(from_customuser_id=user.id).values('to_customuser_id')
+    return FeedTombstone.objects.filter(
+        Q(user=user) | Q(user__isnull=True, author_id__in=followed),
+        id__gt=cursor.tombstone_id,
+    ).order_by('id')
+
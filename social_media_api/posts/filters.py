@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db.models import Case, FloatField, Value, When
+from rest_framework import filters
+
+from . import search
+
+
+class PostSearchFilter(filters.SearchFilter):
+    """?search= against the full-text index, annotating each match with search_rank.
+
+    Falls back to SearchFilter's icontains lookups on databases without an index.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+
+        matches = search.search_post_ids(query, settings.SEARCH_MAX_RESULTS)
+        if matches is None:
+            return super().filter_queryset(request, queryset, view)
+        if not matches:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        rank = Case(
+            *[When(pk=post_id, then=Value(float(score))) for post_id, score in matches],
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=[post_id for post_id, _ in matches]).annotate(search_rank=rank)
@@ -0,0 +1,72 @@
+from django.db import IntegrityError, transaction
+
+from notifications.utils import create_notification
+
+from .counters import change_post_counts
+from .feed_cache import bump_feed_versions
+from .models import Like, Post
+from .trending import record_engagement
+
+
+def _notify_like(user, post):
+    if post.author_id != user.id:
+        create_notification(recipient=post.author, actor=user, verb="liked your post", target=post)
+
+
+def like_post(user, post):
+    """Like a post with a single INSERT; returns False if it was already liked.
+
+    The (user, post) unique constraint settles concurrent requests, so there
+    is no exists() check to race against.
+    """
+    try:
+        with transaction.atomic():
+            Like.objects.create(user=user, post=post)
+    except IntegrityError:
+        return False
+    change_post_counts(post.id, likes=1, using=post._state.db)
+    record_engagement(post.id, likes=1)
+    # liked_by_me on the viewer's cached feed pages is now stale
+    bump_feed_versions([user.id])
+    _notify_like(user, post)
+    return True
+
+
+def unlike_post(user, post_id, using=None):
+    """Remove a like with a single DELETE; returns False if there was none."""
+    deleted, _ = Like.objects.db_manager(using).filter(user=user, post_id=post_id).delete()
+    if not deleted:
+        return False
+    change_post_counts(post_id, likes=-1, using=using)
+    bump_feed_versions([user.id])
+    return True
+
+
+@transaction.atomic
+def apply_like_operations(user, operations):
+    """Apply queued like/unlike operations; the last operation per post wins.
+
+    Each post gets like_post() or unlike_post(), so counters and notifications
+    follow the rows actually inserted or deleted, even when a concurrent
+    request liked or unliked the same post first.
+
+    Returns one result per post, in the order the posts first appear.
+    """
+    wanted = {}
+    for operation in operations:
+        wanted[operation['post']] = operation['action'] == 'like'
+
+    posts = Post.objects.select_related('author').in_bulk(list(wanted))
+    for pk, post in posts.items():
+        if wanted[pk]:
+            like_post(user, post)
+        else:
+            unlike_post(user, pk, using=post._state.db)
+
+    counts = dict(Post.objects.filter(id__in=posts).with_counter_totals().values_list('id', 'like_total'))
+    return [
+        {'post': pk, 'liked': wanted[pk], 'like_count': counts[pk]}
+        if pk in posts else
+        {'post': pk, 'detail': 'Not found.'}
+        for pk in wanted
+    ]
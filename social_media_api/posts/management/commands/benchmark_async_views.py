@@ -0,0 +1,116 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from accounts.models import CustomUser
+from posts.benchmark import LATENCY_ENV
+from posts.models import Post
+from posts.timeline import backfill_timeline
+
+PATHS = {
+    'feed': '/api/feed/',
+    'notifications': '/notification/',
+    'followers': '/accounts/users/{author}/followers/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec of the sync and async read views under uvicorn with many "
+        "concurrent clients and a slow database. Needs uvicorn installed and a migrated "
+        "database; the benchmark users and posts are deleted again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(PATHS), default='feed')
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument(
+            '--latency', type=float, default=0.01,
+            help="Seconds added to every database query the server runs.",
+        )
+        parser.add_argument('--posts', type=int, default=200)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError("uvicorn is not installed.")
+
+        author = CustomUser.objects.create_user(username='benchmark-author', password=None)
+        reader = CustomUser.objects.create_user(username='benchmark-reader', password=None)
+        try:
+            Post.objects.bulk_create(
+                Post(author=author, title=f"Post {i}", content="Body " * 20) for i in range(options['posts'])
+            )
+            reader.following.add(author)
+            backfill_timeline(reader, author)
+            token = Token.objects.create(user=reader)
+            path = PATHS[options['endpoint']].format(author=author.id)
+
+            results = {}
+            for mode in ('sync', 'async'):
+                results[mode] = self.run_server(mode == 'async', path, token.key, options)
+                self.stdout.write(f"{mode:>5}: {results[mode]:.1f} requests/sec")
+            self.stdout.write(self.style.SUCCESS(f"async/sync: {results['async'] / results['sync']:.2f}x"))
+        finally:
+            CustomUser.objects.filter(pk__in=[author.pk, reader.pk]).delete()
+
+    def run_server(self, async_views, path, token, options):
+        env = {**os.environ, 'ASYNC_VIEWS': str(async_views), LATENCY_ENV: str(options['latency'])}
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'uvicorn', '--factory', 'posts.benchmark:application',
+                '--port', str(options['port']), '--log-level', 'warning',
+            ],
+            env=env,
+        )
+        try:
+            self.wait_for_port(options['port'])
+            completed, elapsed = asyncio.run(self.load(path, token, options))
+        finally:
+            server.terminate()
+            server.wait()
+        if not completed:
+            raise CommandError(f"No successful responses from {path}.")
+        return completed / elapsed
+
+    def wait_for_port(self, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError("uvicorn didn't start.")
+
+    async def load(self, path, token, options):
+        headers = f"Host: 127.0.0.1\r\nAuthorization: Token {token}\r\nConnection: close\r\n\r\n"
+        start = time.monotonic()
+        deadline = start + options['duration']
+
+        async def client(number):
+            completed = sent = 0
+            while time.monotonic() < deadline:
+                # a distinct query string per request keeps the feed page cache out of it
+                sent += 1
+                url = f"{path}?client={number}&request={sent}"
+                reader, writer = await asyncio.open_connection('127.0.0.1', options['port'])
+                writer.write(f"GET {url} HTTP/1.1\r\n{headers}".encode())
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                if response.startswith(b'HTTP/1.1 200'):
+                    completed += 1
+            return completed
+
+        counts = await asyncio.gather(*(client(number) for number in range(options['clients'])))
+        return sum(counts), time.monotonic() - start
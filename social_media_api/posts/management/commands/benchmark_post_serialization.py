@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import CustomUser
+from posts.models import Post
+from posts.serializers import PostSerializer
+from social_media_api.compiled import compile_serializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering a list of posts through PostSerializer against the compiled "
+        ".values() fast path. Rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.benchmark(options['rows'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def benchmark(self, rows, repeat):
+        author = CustomUser.objects.create_user(username='benchmark-author', password=None)
+        viewer = CustomUser.objects.create_user(username='benchmark-viewer', password=None)
+        Post.objects.bulk_create(
+            (Post(author=author, title=f"Post {i}", content="Body " * 20) for i in range(rows)),
+            batch_size=1000,
+        )
+        posts = (
+            Post.objects.filter(author=author).order_by('-created_at', '-id')
+            .select_related('author').with_counter_totals().with_viewer_state(viewer)
+        )
+        serializer = PostSerializer(context={'include': set()})
+        compiled = compile_serializer(serializer)
+        if compiled is None:
+            raise CommandError("PostSerializer can't be compiled, is COMPILED_SERIALIZERS off?")
+
+        def regular():
+            return JSONRenderer().render(PostSerializer(posts, many=True, context=serializer.context).data)
+
+        def fast():
+            return JSONRenderer().render(compiled.to_representation(compiled.values(posts)))
+
+        if regular() != fast():
+            raise CommandError("Compiled output differs from PostSerializer.")
+
+        regular_time = self.best_of(regular, repeat)
+        fast_time = self.best_of(fast, repeat)
+        self.stdout.write(f"PostSerializer: {regular_time * 1000:.1f} ms for {rows} posts")
+        self.stdout.write(f"compiled:       {fast_time * 1000:.1f} ms for {rows} posts")
+        self.stdout.write(self.style.SUCCESS(f"{regular_time / fast_time:.1f}x faster, identical output"))
+
+    def best_of(self, render, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import EngagementBucket
+from posts.trending import WINDOWS
+
+
+class Command(BaseCommand):
+    help = "Delete trending engagement buckets older than the longest trending window."
+
+    def add_arguments(self, parser):
+        longest = max(span for span, _ in WINDOWS.values())
+        parser.add_argument(
+            '--hours', type=int, default=int(longest.total_seconds() // 3600) + 1,
+            help="Keep buckets from the last this many hours.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted, _ = EngagementBucket.objects.filter(bucket_start__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} engagement buckets."))
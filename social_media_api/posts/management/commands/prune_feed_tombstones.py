@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import FeedTombstone
+
+
+class Command(BaseCommand):
+    help = "Delete feed tombstones older than the delta sync cursor retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.FEED_TOMBSTONE_RETENTION_DAYS,
+            help="Keep tombstones from the last this many days.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = FeedTombstone.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} feed tombstones."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Reindex every post in the full-text search index, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if search.get_backend() is None:
+            self.stderr.write("This database has no full-text search index.")
+            return
+
+        posts = Post.objects.select_related('author').only('id', 'title', 'content', 'author__username')
+        last_id = 0
+        indexed = 0
+        while True:
+            chunk = list(posts.filter(id__gt=last_id).order_by('id')[:options['chunk_size']])
+            if not chunk:
+                break
+            search.index_posts(chunk)
+            last_id = chunk[-1].id
+            indexed += len(chunk)
+
+        search.remove_orphans()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} posts."))
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count
+
+from posts.models import Comment, Like, Post, PostCounterShard
+from social_media_api import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Post.like_count and Post.comment_count from the like and comment "
+        "tables, folding any sharded counter rows back into the post."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        checked = repaired = 0
+
+        # a post, its likes, comments and counter rows share a database, recount each on its own
+        for using in settings.POST_SHARDS if sharding.enabled() else [DEFAULT_DB_ALIAS]:
+            last_id = 0
+            while True:
+                post_ids = list(
+                    Post.objects.using(using).filter(id__gt=last_id).order_by('id')
+                    .values_list('id', flat=True)[:chunk_size]
+                )
+                if not post_ids:
+                    break
+                last_id = post_ids[-1]
+                checked += len(post_ids)
+                repaired += self.recount(using, post_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} posts, repaired {repaired}."))
+
+    def recount(self, using, post_ids):
+        # Lock the chunk's posts and counter shard rows, so an increment to either
+        # waits for the new totals and lands on top of them; a shard row deleted
+        # here is recreated by the waiting increment. Likes and comments are
+        # committed just before their increment, so one committed in between can
+        # still be counted twice; running the command again settles it.
+        with transaction.atomic(using=using):
+            posts = list(
+                Post.objects.using(using).select_for_update().filter(id__in=post_ids)
+                .only('id', 'like_count', 'comment_count')
+            )
+            shard_ids = list(
+                PostCounterShard.objects.using(using).select_for_update().filter(post_id__in=post_ids)
+                .values_list('id', flat=True)
+            )
+            likes = dict(
+                Like.objects.using(using).filter(post_id__in=post_ids)
+                .values('post_id').annotate(n=Count('id')).values_list('post_id', 'n')
+            )
+            comments = dict(
+                Comment.objects.using(using).filter(post_id__in=post_ids)
+                .values('post_id').annotate(n=Count('id')).values_list('post_id', 'n')
+            )
+
+            drifted = []
+            for post in posts:
+                like_count, comment_count = likes.get(post.id, 0), comments.get(post.id, 0)
+                if (post.like_count, post.comment_count) != (like_count, comment_count):
+                    post.like_count, post.comment_count = like_count, comment_count
+                    drifted.append(post)
+
+            Post.objects.using(using).bulk_update(drifted, ['like_count', 'comment_count'])
+            # only the locked rows, one created since holds an increment made after the lock
+            PostCounterShard.objects.using(using).filter(id__in=shard_ids).delete()
+            return len(drifted)
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from accounts.models import CustomUser
+from posts.models import TimelineEntry
+from posts.timeline import cap_timeline
+
+
+class Command(BaseCommand):
+    help = "Drop each user's timeline rows beyond the newest FEED_TIMELINE_LIMIT."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int, default=settings.FEED_TIMELINE_LIMIT,
+            help="Timeline rows kept per user.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        keep, chunk_size = options['keep'], options['chunk_size']
+        last_id = 0
+        trimmed = deleted = 0
+
+        while True:
+            user_ids = list(
+                CustomUser.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            over = (
+                TimelineEntry.objects.filter(user_id__in=user_ids)
+                .values('user_id').annotate(n=Count('id')).filter(n__gt=keep)
+                .values_list('user_id', flat=True)
+            )
+            for user_id in over:
+                deleted += cap_timeline(user_id, keep)
+                trimmed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Trimmed {trimmed} timelines, deleted {deleted} rows."))
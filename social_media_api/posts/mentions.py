@@ -0,0 +1,33 @@
+import re
+
+from accounts.models import CustomUser
+from notifications.utils import create_notifications
+
+# usernames may contain . + - but a mention doesn't end on them, e.g. "thanks @bob."
+MENTION_RE = re.compile(r'(?<![\w@])@(\w(?:[\w.+-]*\w)?)')
+MAX_MENTIONS = 50
+
+
+def extract_mentions(text):
+    """Mentioned usernames in order of first appearance, at most MAX_MENTIONS."""
+    return list(dict.fromkeys(MENTION_RE.findall(text)))[:MAX_MENTIONS]
+
+
+def notify_mentions(actor, items, verb):
+    """Notify the users @mentioned in (text, target) pairs: one lookup, one insert."""
+    mentions = [(target, extract_mentions(text)) for text, target in items]
+    names = {name for _, target_names in mentions for name in target_names}
+    if not names:
+        return
+    user_ids = dict(
+        CustomUser.objects.filter(username__in=names).exclude(pk=actor.pk).values_list('username', 'id')
+    )
+    create_notifications(
+        actor=actor,
+        verb=verb,
+        targets=[
+            (user_ids[name], target)
+            for target, target_names in mentions
+            for name in target_names if name in user_ids
+        ],
+    )
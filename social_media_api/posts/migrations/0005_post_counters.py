@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_engagement(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.annotate(
+        likes_n=Count('likes', distinct=True), comments_n=Count('comments', distinct=True)
+    ).filter(models.Q(likes_n__gt=0) | models.Q(comments_n__gt=0))
+    for post in posts.iterator():
+        Post.objects.filter(pk=post.pk).update(like_count=post.likes_n, comment_count=post.comments_n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PostCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('like_count', models.IntegerField(default=0)),
+                ('comment_count', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='posts.post')),
+            ],
+            options={
+                'unique_together': {('post', 'shard')},
+            },
+        ),
+        migrations.RunPython(count_engagement, migrations.RunPython.noop),
+    ]
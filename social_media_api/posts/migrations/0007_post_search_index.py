@@ -0,0 +1,36 @@
+from django.db import migrations
+
+CREATE_SQL = {
+    'postgresql': [
+        "CREATE TABLE posts_post_search ("
+        "post_id bigint PRIMARY KEY REFERENCES posts_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "document tsvector NOT NULL)",
+        "CREATE INDEX posts_post_search_document ON posts_post_search USING GIN (document)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE posts_post_search USING fts5("
+        "title, content, author_username, tokenize='porter unicode61')",
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute("DROP TABLE posts_post_search")
+
+
+class Migration(migrations.Migration):
+    """Creates the full-text table only; fill it with `manage.py rebuild_post_search_index`."""
+
+    dependencies = [
+        ('posts', '0006_engagementbucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
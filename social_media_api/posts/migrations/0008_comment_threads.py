@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# copied from posts.models as it was when this migration was written
+PATH_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+PATH_SEGMENT_LENGTH = 13
+
+
+def path_segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        digits = PATH_DIGITS[remainder] + digits
+    return digits.rjust(PATH_SEGMENT_LENGTH, '0')
+
+
+def fill_paths(apps, schema_editor):
+    # every existing comment is top-level
+    Comment = apps.get_model('posts', 'Comment')
+    for pk in Comment.objects.filter(path='').values_list('pk', flat=True).iterator():
+        Comment.objects.filter(pk=pk).update(path=path_segment(pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='posts_comment_post_path', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+    ]
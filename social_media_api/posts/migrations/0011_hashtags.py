@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:35
+
+import re
+
+import django.db.models.deletion
+import taggit.managers
+from django.db import migrations, models
+
+# copied from posts.tags as it was when this migration was written
+HASHTAG_RE = re.compile(r'(?<![\w#&/])#(\w*[^\W\d]\w*)')
+MAX_TAG_LENGTH = 100
+
+
+def extract_hashtags(text):
+    tags = (match.lower() for match in HASHTAG_RE.findall(text))
+    return list(dict.fromkeys(tag for tag in tags if len(tag) <= MAX_TAG_LENGTH))
+
+
+def tag_posts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    TaggedPost = apps.get_model('posts', 'TaggedPost')
+    Tag = apps.get_model('taggit', 'Tag')
+    posts = Post.objects.filter(content__contains='#').values_list('id', 'content', 'created_at')
+    for post_id, content, created_at in posts.iterator(chunk_size=1000):
+        names = extract_hashtags(content)
+        if not names:
+            continue
+        Tag.objects.bulk_create([Tag(name=name, slug=name) for name in names], ignore_conflicts=True)
+        TaggedPost.objects.bulk_create(
+            [
+                TaggedPost(content_object_id=post_id, tag_id=tag_id, created_at=created_at)
+                for tag_id in Tag.objects.filter(slug__in=names).values_list('id', flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_feed_tombstones'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaggedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('content_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tagged_items', to='posts.post')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_items', to='taggit.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='tags',
+            field=taggit.managers.TaggableManager(blank=True, help_text='A comma-separated list of tags.', through='posts.TaggedPost', to='taggit.Tag', verbose_name='Tags'),
+        ),
+        migrations.AddIndex(
+            model_name='taggedpost',
+            index=models.Index(fields=['tag', '-created_at', '-id'], name='posts_tagged_tag_created'),
+        ),
+        migrations.AddIndex(
+            model_name='taggedpost',
+            index=models.Index(fields=['created_at'], name='posts_tagged_created'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='taggedpost',
+            unique_together={('content_object', 'tag')},
+        ),
+        migrations.RunPython(tag_posts, migrations.RunPython.noop),
+    ]
@@ -1,31 +1,222 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from taggit.managers import TaggableManager
+from taggit.models import TaggedItemBase
 from accounts.models import CustomUser
+from social_media_api.sharding import ShardedQuerySet
+from social_media_api.snowflake import SnowflakeModel
 
-class Post(models.Model):
-    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='posts')
+
+class PostQuerySet(ShardedQuerySet):
+    def with_counter_totals(self):
+        """Annotate like_total/comment_total, adding any sharded counter rows."""
+        if settings.POST_COUNTER_SHARDS <= 1:
+            return self.annotate(like_total=F('like_count'), comment_total=F('comment_count'))
+
+        shards = PostCounterShard.objects.filter(post=OuterRef('pk')).values('post')
+
+        def shard_sum(field):
+            total = shards.annotate(total=Sum(field)).values('total')
+            return Coalesce(Subquery(total), 0)
+
+        return self.annotate(
+            like_total=F('like_count') + shard_sum('like_count'),
+            comment_total=F('comment_count') + shard_sum('comment_count'),
+        )
+
+    def with_viewer_state(self, user):
+        """Annotate liked_by_me/commented_by_me as EXISTS subqueries, one query per page."""
+        if not user.is_authenticated:
+            return self.annotate(liked_by_me=Value(False), commented_by_me=Value(False))
+        return self.annotate(
+            liked_by_me=Exists(Like.objects.filter(post=OuterRef('pk'), user=user)),
+            commented_by_me=Exists(Comment.objects.filter(post=OuterRef('pk'), author=user)),
+        )
+
+
+class Post(SnowflakeModel):
+    # no constraint on keys that may point into another database, see social_media_api.sharding
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='posts', db_constraint=False)
     title = models.CharField(max_length=50)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # maintained by posts.counters, repaired by the recount_post_stats command
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # hashtags from the content, kept in sync by posts.tags
+    tags = TaggableManager(through='TaggedPost', blank=True)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='posts_post_created'),
+            models.Index(fields=['author', '-created_at', '-id'], name='posts_post_author_created'),
+            # feed delta sync, see posts.feed_changes
+            models.Index(fields=['author', 'updated_at', 'id'], name='posts_post_author_updated'),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.username}"
 
-class Comment(models.Model):
+PATH_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+# 13 base-36 digits hold any 64-bit id, so siblings sort by id as plain strings
+PATH_SEGMENT_LENGTH = 13
+MAX_COMMENT_DEPTH = 255 // PATH_SEGMENT_LENGTH - 1
+
+
+def path_segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        digits = PATH_DIGITS[remainder] + digits
+    return digits.rjust(PATH_SEGMENT_LENGTH, '0')
+
+
+class Comment(SnowflakeModel):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
-    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='comments')
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='comments', db_constraint=False)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='replies', null=True, blank=True)
+    # materialized path: the ancestors' path segments followed by this comment's own,
+    # so a whole thread or subtree is one prefix range on (post, path)
+    path = models.CharField(max_length=255, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='posts_comment_post_created'),
+            # the pattern opclass lets Postgres serve path LIKE 'prefix%' from the index
+            models.Index(
+                fields=['post', 'path'], name='posts_comment_post_path',
+                opclasses=['int8_ops', 'varchar_pattern_ops'],
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.parent_id and not self.path:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if not self.path:
+            # the path ends with our own id, which only exists after the insert
+            self.path = (self.parent.path if self.parent_id else '') + path_segment(self.pk)
+            Comment.objects.using(self._state.db).filter(pk=self.pk).update(path=self.path)
+
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
     
-class Like(models.Model):
+class Like(SnowflakeModel):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='likes')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='likes', db_constraint=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='posts_like_post_created'),
+        ]
 
     def __str__(self):
         return f"Like by {self.user.username} on post {self.post.title}"
+
+
+class TaggedPost(TaggedItemBase):
+    """A hashtag on a post."""
+    content_object = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='tagged_items', db_constraint=False
+    )
+    # copied from the post so a tag timeline is read in order from this table's index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('content_object', 'tag')
+        indexes = [
+            models.Index(fields=['tag', '-created_at', '-id'], name='posts_tagged_tag_created'),
+            models.Index(fields=['created_at'], name='posts_tagged_created'),
+        ]
+
+
+class PostCounterShard(models.Model):
+    """Counter deltas for a post, spread over several rows so hot posts don't
+    serialize every like on a single row lock. Summed into the totals on read."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    like_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('post', 'shard')
+
+    def __str__(self):
+        return f"Counter shard {self.shard} of post {self.post_id}"
+
+
+class EngagementBucket(models.Model):
+    """Likes and comments a post received during one TRENDING_BUCKET_SECONDS slot."""
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='engagement_buckets', db_constraint=False
+    )
+    bucket_start = models.DateTimeField()
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'bucket_start')
+        indexes = [
+            models.Index(fields=['bucket_start'], name='posts_engagement_start'),
+        ]
+
+    def __str__(self):
+        return f"Engagement on post {self.post_id} from {self.bucket_start}"
+
+
+class TimelineEntry(models.Model):
+    """A post materialized into one follower's feed."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries', db_constraint=False)
+    # copied from the post so the feed can be read in order from this table's index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='posts_timeline_user_created'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.user_id}'s timeline"
+
+
+class FeedTombstone(models.Model):
+    """A post, or all of an author's posts when post_id is null, gone from feeds.
+
+    Deletions are one row with no user, seen by everyone following the author.
+    An unfollow is a row for that user alone.
+    """
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name='feed_tombstones', null=True, blank=True
+    )
+    # plain ids, the post and possibly its author are gone
+    author_id = models.BigIntegerField()
+    post_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author_id', 'id'], name='posts_tombstone_author'),
+            models.Index(fields=['created_at'], name='posts_tombstone_created'),
+        ]
+
+    def __str__(self):
+        return f"Tombstone for post {self.post_id} by {self.author_id}"
@@ -0,0 +1,124 @@
+import base64
+from datetime import datetime
+
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+from social_media_api import snowflake
+
+
+class NewestFirstPagination(CursorPagination):
+    """Keyset pagination on (created_at, id): no COUNT and no OFFSET scan per page."""
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        # full-text matches page by relevance instead (see PostSearchFilter)
+        if 'search_rank' in queryset.query.annotations:
+            return ('-search_rank', '-id')
+        if snowflake.enabled():
+            # ids are time ordered, the primary key alone is the cursor
+            return ('-id',)
+        return super().get_ordering(request, queryset, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() reading the page through the async ORM.
+
+        Follows CursorPagination.paginate_queryset, only the fetch is awaited.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            order = self.ordering[0]
+            order_attr = order.lstrip('-')
+            lookup = 'lt' if self.cursor.reverse != order.startswith('-') else 'gt'
+            queryset = queryset.filter(**{f'{order_attr}__{lookup}': current_position})
+
+        results = [item async for item in queryset[offset:offset + self.page_size + 1]]
+        self.page = results[:self.page_size]
+
+        has_following_position = len(results) > len(self.page)
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if has_following_position else None
+        )
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+        return self.page
+
+
+def encode_key(key):
+    created_at, pk = key
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()} {pk}'.encode()).decode()
+
+
+def decode_key(encoded):
+    """(created_at, id) from its encoded form, ValueError if it isn't one."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split(' ')
+        key = datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor.") from e
+    if timezone.is_naive(key[0]):
+        raise ValueError("Invalid cursor.")
+    return key
+
+
+class FeedPagination(NewestFirstPagination):
+    """Keyset pages over (created_at, id) keys read by the caller, as the feed's are.
+
+    The view reads limit keys below start's key, newest first, and hands them
+    to cut(). There is no previous link.
+    """
+
+    def start(self, request):
+        """(key the page starts below or None, how many keys to read)."""
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        encoded = request.query_params.get(self.cursor_query_param)
+        try:
+            before = decode_key(encoded) if encoded else None
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        return before, self.page_size + 1
+
+    def cut(self, keys):
+        """Post ids on this page."""
+        self.next_key = keys[self.page_size - 1] if len(keys) > self.page_size else None
+        return [pk for _, pk in keys[:self.page_size]]
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, encode_key(self.next_key))
+
+    def get_previous_link(self):
+        return None
+
+
+class TagTimelinePagination(CursorPagination):
+    """Keyset pagination over TaggedPost rows, newest post first."""
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,64 @@
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from accounts.restrictions import hidden_author_ids, hidden_mask
+from .models import Comment, Like
+
+# relative weight of each signal before the recency decay is applied
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+AFFINITY_WEIGHT = 1.5
+HALF_LIFE_HOURS = 24.0
+
+
+def engagement_scores(age_hours, likes, comments, affinity):
+    """Score a whole candidate window at once; every argument is a 1-d array."""
+    engagement = (
+        1.0
+        + LIKE_WEIGHT * np.log1p(likes)
+        + COMMENT_WEIGHT * np.log1p(comments)
+        + AFFINITY_WEIGHT * np.log1p(affinity)
+    )
+    return engagement * np.exp2(-age_hours / HALF_LIFE_HOURS)
+
+
+def rank_post_ids(user, posts):
+    """Ids of the newest candidate posts, best engagement score first.
+
+    posts must carry the with_counter_totals() annotations.
+    """
+    candidates = list(
+        posts.order_by('-created_at', '-id').values_list(
+            'id', 'author_id', 'created_at', 'like_total', 'comment_total'
+        )[:settings.FEED_RANKING_CANDIDATES]
+    )
+    if not candidates:
+        return []
+
+    post_ids, author_ids, created, likes, comments = zip(*candidates)
+    ids = np.array(post_ids, dtype=np.int64)
+    like_counts = np.array(likes, dtype=np.float64)
+    comment_counts = np.array(comments, dtype=np.float64)
+
+    # how often the viewer has liked or commented on each candidate author
+    authors, author_index = np.unique(np.array(author_ids, dtype=np.int64), return_inverse=True)
+    liked = Like.objects.filter(user=user, post__author_id__in=authors.tolist())
+    commented = Comment.objects.filter(author=user, post__author_id__in=authors.tolist())
+    interactions = list(liked.values('post__author_id').annotate(n=Count('id')).values_list('post__author_id', 'n'))
+    interactions += list(commented.values('post__author_id').annotate(n=Count('id')).values_list('post__author_id', 'n'))
+    affinity = np.zeros(len(authors))
+    if interactions:
+        keys, counts = np.array(interactions, dtype=np.int64).T
+        np.add.at(affinity, np.searchsorted(authors, keys), counts)
+
+    now = timezone.now().timestamp()
+    timestamps = np.fromiter((c.timestamp() for c in created), dtype=np.float64, count=len(created))
+    age_hours = np.maximum(now - timestamps, 0.0) / 3600.0
+
+    scores = engagement_scores(age_hours, like_counts, comment_counts, affinity[author_index])
+    # stable sort keeps newest-first order between equal scores
+    order = np.argsort(-scores, kind='stable')
+    hidden = hidden_mask(author_ids, hidden_author_ids(user))
+    return ids[order[~hidden[order]]].tolist()
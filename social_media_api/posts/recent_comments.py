@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from accounts.restrictions import NO_IDS
+from .models import Comment
+
+
+def attach_recent_comments(posts, hidden=NO_IDS, limit=None):
+    """Set post.recent_comments on every post with one ROW_NUMBER() query.
+
+    Comments by the hidden author ids (see accounts.restrictions) are left out
+    before the rows are numbered, so they don't use up a post's limit.
+    """
+    limit = limit or settings.RECENT_COMMENTS_LIMIT
+    by_id = {post.id: post for post in posts}
+    for post in by_id.values():
+        post.recent_comments = []
+    if not by_id:
+        return
+
+    comments = (
+        Comment.objects.filter(post_id__in=by_id)
+        .exclude(author_id__in=hidden.tolist())
+        .select_related('author')
+        .annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F('post_id'),
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(row_number__lte=limit)
+    )
+    # ordered here rather than in SQL, so the query can also run once per shard
+    comments = sorted(comments, key=lambda comment: comment.row_number)
+    for comment in comments:
+        by_id[comment.post_id].recent_comments.append(comment)
@@ -0,0 +1,142 @@
+"""Full-text index over posts.
+
+Postgres keeps a weighted tsvector per post in posts_post_search behind a GIN
+index; SQLite uses an FTS5 virtual table of the same name. The table is
+created by migration 0007 and kept in sync by posts.signals. Its post_id
+has no foreign key since posts can live on shards (migration 0012), so
+remove_orphans() clears the rows of deleted posts.
+"""
+import re
+
+from django.db import connection
+
+from social_media_api import sharding
+from .models import Post
+
+TABLE = 'posts_post_search'
+ORPHAN_CHUNK_SIZE = 1000
+TOKEN_RE = re.compile(r'\w+')
+
+
+class PostgresSearch:
+    upsert_sql = (
+        f"INSERT INTO {TABLE} (post_id, document) VALUES (%s, "
+        "setweight(to_tsvector('english', %s), 'A') || "
+        "setweight(to_tsvector('english', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'A')) "
+        "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+
+    def index(self, cursor, rows):
+        cursor.executemany(self.upsert_sql, rows)
+
+    def delete(self, cursor, post_ids):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE post_id = ANY(%s)", [list(post_ids)])
+
+    def delete_orphans(self, cursor):
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE NOT EXISTS (SELECT 1 FROM posts_post WHERE posts_post.id = {TABLE}.post_id)"
+        )
+
+    def indexed_ids(self, cursor, after, limit):
+        cursor.execute(f"SELECT post_id FROM {TABLE} WHERE post_id > %s ORDER BY post_id LIMIT %s", [after, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+    def search(self, cursor, query, limit):
+        cursor.execute(
+            f"SELECT post_id, ts_rank(document, query) FROM {TABLE}, "
+            "websearch_to_tsquery('english', %s) query "
+            "WHERE document @@ query ORDER BY 2 DESC LIMIT %s",
+            [query, limit],
+        )
+        return cursor.fetchall()
+
+
+class SQLiteSearch:
+    # bm25 column weights: title, content, author_username
+    rank_sql = f"bm25({TABLE}, 10.0, 1.0, 10.0)"
+
+    def index(self, cursor, rows):
+        self.delete(cursor, [row[0] for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, title, content, author_username) VALUES (%s, %s, %s, %s)", rows
+        )
+
+    def delete(self, cursor, post_ids):
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(post_id,) for post_id in post_ids])
+
+    def delete_orphans(self, cursor):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid NOT IN (SELECT id FROM posts_post)")
+
+    def indexed_ids(self, cursor, after, limit):
+        cursor.execute(f"SELECT rowid FROM {TABLE} WHERE rowid > %s ORDER BY rowid LIMIT %s", [after, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+    def search(self, cursor, query, limit):
+        # quote every word so FTS5 query syntax in user input is matched literally
+        terms = ' '.join(f'"{token}"' for token in TOKEN_RE.findall(query))
+        if not terms:
+            return []
+        cursor.execute(
+            f"SELECT rowid, -{self.rank_sql} FROM {TABLE} WHERE {TABLE} MATCH %s "
+            f"ORDER BY {self.rank_sql} LIMIT %s",
+            [terms, limit],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch(),
+    'sqlite': SQLiteSearch(),
+}
+
+
+def get_backend():
+    """The search backend for the default database, or None if it has none."""
+    return BACKENDS.get(connection.vendor)
+
+
+def index_posts(posts):
+    """(Re)index posts; they should have their author loaded."""
+    backend = get_backend()
+    rows = [(post.id, post.title, post.content, post.author.username) for post in posts]
+    if backend and rows:
+        with connection.cursor() as cursor:
+            backend.index(cursor, rows)
+
+
+def remove_posts(post_ids):
+    backend = get_backend()
+    if backend and post_ids:
+        with connection.cursor() as cursor:
+            backend.delete(cursor, post_ids)
+
+
+def remove_orphans(chunk_size=ORPHAN_CHUNK_SIZE):
+    """Drop index rows whose post is gone."""
+    backend = get_backend()
+    if backend is None:
+        return
+    if not sharding.enabled():
+        with connection.cursor() as cursor:
+            backend.delete_orphans(cursor)
+        return
+    # the posts live on the shards, check the indexed ids against every shard a chunk at a time
+    last_id = 0
+    while True:
+        with connection.cursor() as cursor:
+            post_ids = backend.indexed_ids(cursor, last_id, chunk_size)
+        if not post_ids:
+            break
+        last_id = post_ids[-1]
+        live = set(Post.objects.filter(id__in=post_ids).values_list('id', flat=True))
+        remove_posts([post_id for post_id in post_ids if post_id not in live])
+
+
+def search_post_ids(query, limit):
+    """[(post_id, rank)] best match first, or None if the database has no index."""
+    backend = get_backend()
+    if backend is None:
+        return None
+    with connection.cursor() as cursor:
+        return backend.search(cursor, query, limit)
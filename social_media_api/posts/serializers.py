@@ -1,20 +1,96 @@
 from rest_framework import serializers
-from .models import Post, Comment
 
+from social_media_api.fieldsets import SparseFieldsetMixin
+from social_media_api.snowflake import SnowflakeIdsMixin
+from .models import Post, Comment, Like, MAX_COMMENT_DEPTH
 
-class PostSerializer(serializers.ModelSerializer):
+
+class CommentSerializer(SnowflakeIdsMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     author_username = serializers.ReadOnlyField(source='author.username')
 
     class Meta:
-        model = Post
-        fields = ['id', 'author', 'author_username', 'title', 'content', 'created_at', 'updated_at']
+        model = Comment
+        fields = [
+            'id', 'post', 'parent', 'depth', 'author', 'author_username', 'content', 'created_at', 'updated_at',
+        ]
         read_only_fields = ['author']
 
+    def validate(self, data):
+        post = data.get('post', getattr(self.instance, 'post', None))
+        parent = data.get('parent')
+        if self.instance is not None and 'parent' in data and parent != self.instance.parent:
+            raise serializers.ValidationError({'parent': 'A reply cannot be moved.'})
+        if self.instance is not None and 'post' in data and post.id != self.instance.post_id:
+            raise serializers.ValidationError({'post': 'A comment cannot be moved to another post.'})
+        if self.instance is None and parent is not None:
+            if parent.post_id != post.id:
+                raise serializers.ValidationError({'parent': 'Reply must be on the same post.'})
+            if parent.depth >= MAX_COMMENT_DEPTH:
+                raise serializers.ValidationError({'parent': 'Replies are nested too deeply.'})
+        return data
 
-class CommentSerializer(serializers.ModelSerializer):
+
+class PostSerializer(SnowflakeIdsMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     author_username = serializers.ReadOnlyField(source='author.username')
+    like_count = serializers.SerializerMethodField()
+    comment_count = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
+    commented_by_me = serializers.SerializerMethodField()
+    recent_comments = CommentSerializer(many=True, read_only=True)
 
     class Meta:
-        model = Comment
-        fields = ['id', 'post', 'author', 'author_username', 'content', 'created_at', 'updated_at']
+        model = Post
+        fields = [
+            'id', 'author', 'author_username', 'title', 'content', 'created_at', 'updated_at',
+            'like_count', 'comment_count', 'liked_by_me', 'commented_by_me', 'recent_comments',
+        ]
         read_only_fields = ['author']
+        # queryset values the method fields read, for the compiled fast path
+        value_sources = {
+            'like_count': 'like_total',
+            'comment_count': 'comment_total',
+            'liked_by_me': 'liked_by_me',
+            'commented_by_me': 'commented_by_me',
+        }
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # only rendered for ?include=recent_comments, see attach_recent_comments()
+        if 'recent_comments' not in self.context.get('include', ()):
+            fields.pop('recent_comments', None)
+        return fields
+
+    # list querysets carry with_counter_totals() annotations, single saves fall back to the columns
+    def get_like_count(self, obj):
+        return getattr(obj, 'like_total', obj.like_count)
+
+    def get_comment_count(self, obj):
+        return getattr(obj, 'comment_total', obj.comment_count)
+
+    # from with_viewer_state(); a freshly created post has no viewer state yet
+    def get_liked_by_me(self, obj):
+        return getattr(obj, 'liked_by_me', False)
+
+    def get_commented_by_me(self, obj):
+        return getattr(obj, 'commented_by_me', False)
+
+
+class LikerSerializer(serializers.ModelSerializer):
+    """Slim projection of the user behind a like."""
+    id = serializers.ReadOnlyField(source='user.id')
+    username = serializers.ReadOnlyField(source='user.username')
+    avatar = serializers.ImageField(source='user.profile_picture', read_only=True)
+    liked_at = serializers.DateTimeField(source='created_at', read_only=True)
+
+    class Meta:
+        model = Like
+        fields = ['id', 'username', 'avatar', 'liked_at']
+
+
+class LikeOperationSerializer(serializers.Serializer):
+    post = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['like', 'unlike'])
+
+
+class LikeBatchSerializer(serializers.Serializer):
+    operations = LikeOperationSerializer(many=True, allow_empty=False, max_length=100)
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from social_media_api import sharding
+from .models import Comment, FeedTombstone, Like, Post
+from .search import index_posts, remove_posts
+from .tags import sync_post_tags
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    index_posts([instance])
+
+
+@receiver(post_save, sender=Post)
+def tag_post(sender, instance, created, **kwargs):
+    sync_post_tags([instance], new=created)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    remove_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def bury_post(sender, instance, **kwargs):
+    # picked up by followers through /api/feed/changes/
+    FeedTombstone.objects.create(author_id=instance.author_id, post_id=instance.pk)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def delete_sharded_content(sender, instance, **kwargs):
+    # the user's own cascade runs on the default database and can't reach the shards
+    if sharding.enabled():
+        Like.objects.filter(user=instance).delete()
+        Comment.objects.filter(author=instance).delete()
+        Post.objects.filter(author=instance).delete()
@@ -0,0 +1,71 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+from taggit.models import Tag
+
+from .models import TaggedPost
+
+# a #tag needs at least one letter, and isn't the tail of a word or URL fragment
+HASHTAG_RE = re.compile(r'(?<![\w#&/])#(\w*[^\W\d]\w*)')
+MAX_TAG_LENGTH = 100
+TOP_TAGS_KEY = 'tags:top'
+
+
+def extract_hashtags(text):
+    """Lowercased hashtags in order of first appearance."""
+    tags = (match.lower() for match in HASHTAG_RE.findall(text))
+    return list(dict.fromkeys(tag for tag in tags if len(tag) <= MAX_TAG_LENGTH))
+
+
+def sync_post_tags(posts, new=False):
+    """Make each post's tag rows match the hashtags in its content.
+
+    new skips looking up existing rows for posts that were just inserted.
+    """
+    wanted = {post.id: set(extract_hashtags(post.content)) for post in posts}
+    created_at = {post.id: post.created_at for post in posts}
+    names = set().union(*wanted.values())
+
+    # hashtags are already slug-safe; existing tags are matched on slug
+    Tag.objects.bulk_create([Tag(name=name, slug=name) for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(slug__in=names).values_list('slug', 'id'))
+    slugs = {tag_id: slug for slug, tag_id in tag_ids.items()}
+
+    stale = []
+    existing = TaggedPost.objects.none() if new else TaggedPost.objects.filter(content_object__in=wanted)
+    for row_id, post_id, tag_id in existing.values_list('id', 'content_object_id', 'tag_id'):
+        slug = slugs.get(tag_id)
+        if slug in wanted[post_id]:
+            wanted[post_id].discard(slug)
+        else:
+            stale.append(row_id)
+    if stale:
+        TaggedPost.objects.filter(id__in=stale).delete()
+    TaggedPost.objects.bulk_create(
+        [
+            TaggedPost(content_object_id=post_id, tag_id=tag_ids[name], created_at=created_at[post_id])
+            for post_id, post_names in wanted.items()
+            for name in post_names if name in tag_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def top_tags():
+    """Most used hashtags over the recent window, cached."""
+    results = cache.get(TOP_TAGS_KEY)
+    if results is None:
+        since = timezone.now() - timedelta(hours=settings.TAG_TOP_WINDOW_HOURS)
+        rows = (
+            TaggedPost.objects.filter(created_at__gte=since)
+            .values('tag__name')
+            .annotate(posts=Count('id'))
+            .order_by('-posts', 'tag__name')[:settings.TAG_TOP_LIMIT]
+        )
+        results = [{'tag': row['tag__name'], 'posts': row['posts']} for row in rows]
+        cache.set(TOP_TAGS_KEY, results, settings.TAG_TOP_CACHE_TIMEOUT)
+    return results
@@ -1,3 +1,1110 @@
-from django.test import TestCase
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from accounts.export import export_lines
+from accounts.models import CustomUser
+from accounts.restrictions import hidden_author_ids
+from notifications.models import Notification
+from social_media_api import sharding, snowflake
+from social_media_api.idempotency import cache_keys
+from social_media_api.replicas import replica_reads
+from .views import AsyncFeedView
+from .models import Comment, EngagementBucket, Post, PostCounterShard, TaggedPost, TimelineEntry
+from . import feed_cache
+from .feed_changes import decode_cursor, encode_cursor
+from .mentions import extract_mentions, notify_mentions
+from .tags import extract_hashtags
+from .trending import record_engagement
+
+
+class FeedTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.client.force_authenticate(self.alice)
+
+    def follow(self, user):
+        return self.client.post(f"/accounts/follow/{user.id}/")
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        self.follow(self.bob)
+        self.client.force_authenticate(self.bob)
+        response = self.client.post("/api/posts/", {"title": "Hi", "content": "Hello"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.alice, post_id=response.data["id"]).exists())
+
+        self.client.force_authenticate(self.alice)
+        response = self.client.get(reverse("feed"))
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Hi"])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        Post.objects.create(author=self.bob, title="Old", content="Earlier post")
+        self.follow(self.bob)
+        self.assertEqual(len(self.client.get(reverse("feed")).data["results"]), 1)
+
+        self.client.post(f"/accounts/unfollow/{self.bob.id}/")
+        self.assertFalse(TimelineEntry.objects.filter(user=self.alice).exists())
+        self.assertEqual(self.client.get(reverse("feed")).data["results"], [])
+
+    def test_feed_pages_off_timeline_rows_which_are_capped(self):
+        self.follow(self.bob)
+        self.client.force_authenticate(self.bob)
+        for i in range(5):
+            self.client.post("/api/posts/", {"title": f"Post {i}", "content": "Body"})
+        self.client.force_authenticate(self.alice)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("feed"), {"page_size": 2})
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Post 4", "Post 3"])
+        # the page is cut from the timeline rows, not from a join of all their posts
+        timeline_reads = [q["sql"] for q in queries if 'FROM "posts_timelineentry"' in q["sql"]]
+        self.assertEqual(len(timeline_reads), 1)
+        self.assertIn("LIMIT 3", timeline_reads[0])
+        response = self.client.get(response.data["next"])
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Post 2", "Post 1"])
+        self.assertEqual(self.client.get(reverse("feed"), {"cursor": "bogus"}).status_code, 404)
+
+        call_command("trim_timelines", keep=3, stdout=StringIO())
+        response = self.client.get(reverse("feed"))
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Post 4", "Post 3", "Post 2"])
+
+    @override_settings(FEED_FANOUT_FOLLOWER_LIMIT=0)
+    def test_high_follower_authors_are_pulled_at_read_time(self):
+        self.follow(self.bob)
+        Post.objects.create(author=self.bob, title="Big", content="Celebrity post")
+        self.client.force_authenticate(self.bob)
+        self.client.post("/api/posts/", {"title": "Bigger", "content": "Another"})
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        self.client.force_authenticate(self.alice)
+        response = self.client.get(reverse("feed"))
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Bigger", "Big"])
+
+    def test_feed_is_cached_until_a_followed_author_posts(self):
+        self.follow(self.bob)
+        self.assertEqual(self.client.get(reverse("feed"))["X-Feed-Cache"], "miss")
+        self.assertEqual(self.client.get(reverse("feed"))["X-Feed-Cache"], "hit")
+
+        self.client.force_authenticate(self.bob)
+        self.client.post("/api/posts/", {"title": "New", "content": "Fresh"})
+        self.client.force_authenticate(self.alice)
+        response = self.client.get(reverse("feed"))
+        self.assertEqual(response["X-Feed-Cache"], "miss")
+        self.assertEqual([p["title"] for p in response.data["results"]], ["New"])
+        self.assertEqual(feed_cache.stats(), {"hits": 1, "misses": 2})
+
+    def test_engagement_ranking_puts_liked_posts_first(self):
+        self.follow(self.bob)
+        self.client.force_authenticate(self.bob)
+        popular = self.client.post("/api/posts/", {"title": "Popular", "content": "Liked"}).data["id"]
+        self.client.post("/api/posts/", {"title": "Quiet", "content": "No likes"})
+        for name in ("carol", "dave"):
+            self.client.force_authenticate(CustomUser.objects.create_user(username=name, password="pass12345"))
+            self.client.post(f"/api/posts/{popular}/like/")
+
+        self.client.force_authenticate(self.alice)
+        response = self.client.get(reverse("feed"))
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Quiet", "Popular"])
+        response = self.client.get(reverse("feed"), {"ranking": "engagement"})
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Popular", "Quiet"])
+        self.assertEqual(self.client.get(reverse("feed"), {"ranking": "bogus"}).status_code, 400)
+
+class CounterTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.post = Post.objects.create(author=self.alice, title="Counted", content="Body")
+        self.client.force_authenticate(self.alice)
+
+    def exercise(self):
+        self.client.post(f"/api/posts/{self.post.id}/like/")
+        comment = self.client.post("/api/comments/", {"post": self.post.id, "content": "One"}).data
+        self.client.post("/api/comments/", {"post": self.post.id, "content": "Two"})
+        self.client.delete(f"/api/comments/{comment['id']}/")
+        data = self.client.get(f"/api/posts/{self.post.id}/").data
+        return data["like_count"], data["comment_count"]
+
+    def test_counts_follow_likes_and_comments(self):
+        self.assertEqual(self.exercise(), (1, 1))
+        self.client.post(f"/api/posts/{self.post.id}/unlike/")
+        self.assertEqual(self.client.get(f"/api/posts/{self.post.id}/").data["like_count"], 0)
+
+    @override_settings(POST_COUNTER_SHARDS=4)
+    def test_sharded_counts_are_summed_and_folded_by_recount(self):
+        self.assertEqual(self.exercise(), (1, 1))
+        self.assertTrue(PostCounterShard.objects.exists())
+
+        Post.objects.filter(pk=self.post.pk).update(like_count=7)
+        call_command("recount_post_stats", stdout=StringIO())
+        self.assertFalse(PostCounterShard.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+
+
+class ViewerStateTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.posts = [
+            Post.objects.create(author=self.alice, title=f"Post {i}", content="Body") for i in range(3)
+        ]
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/api/posts/{self.posts[0].id}/like/")
+        self.client.post("/api/comments/", {"post": self.posts[1].id, "content": "Mine"})
+
+    def test_list_annotates_viewer_state_in_one_query(self):
+        hidden_author_ids(self.alice)  # cached after the viewer's first request
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/posts/")
+        state = {p["id"]: (p["liked_by_me"], p["commented_by_me"]) for p in response.data["results"]}
+        self.assertEqual(state, {
+            self.posts[0].id: (True, False),
+            self.posts[1].id: (False, True),
+            self.posts[2].id: (False, False),
+        })
+
+    def test_anonymous_viewer_state_is_false(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(f"/api/posts/{self.posts[0].id}/")
+        self.assertFalse(response.data["liked_by_me"])
+
+
+class LikeTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.post = Post.objects.create(author=self.alice, title="Likeable", content="Body")
+        self.client.force_authenticate(self.bob)
+        self.url = f"/api/posts/{self.post.id}/like/"
+
+    def test_put_and_delete_are_idempotent(self):
+        for _ in range(2):
+            response = self.client.put(self.url)
+            self.assertEqual(response.data, {"liked": True, "like_count": 1})
+        for _ in range(2):
+            response = self.client.delete(self.url)
+            self.assertEqual(response.data, {"liked": False, "like_count": 0})
+        self.assertEqual(self.client.put("/api/posts/0/like/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_batch_applies_the_last_operation_per_post(self):
+        other = Post.objects.create(author=self.alice, title="Other", content="Body")
+        response = self.client.post("/api/likes/batch/", {"operations": [
+            {"post": self.post.id, "action": "like"},
+            {"post": other.id, "action": "like"},
+            {"post": other.id, "action": "unlike"},
+            {"post": 0, "action": "like"},
+        ]}, format="json")
+        self.assertEqual(response.data["results"], [
+            {"post": self.post.id, "liked": True, "like_count": 1},
+            {"post": other.id, "liked": False, "like_count": 0},
+            {"post": 0, "detail": "Not found."},
+        ])
+        self.assertEqual(self.alice.notifications.count(), 1)
+
+    def test_batch_counts_only_rows_it_wrote(self):
+        self.client.put(self.url)
+        operations = [{"post": self.post.id, "action": "like"}]
+        response = self.client.post("/api/likes/batch/", {"operations": operations}, format="json")
+        self.assertEqual(response.data["results"], [{"post": self.post.id, "liked": True, "like_count": 1}])
+        self.assertEqual(self.alice.notifications.count(), 1)
+
+        self.client.delete(self.url)
+        operations = [{"post": self.post.id, "action": "unlike"}]
+        response = self.client.post("/api/likes/batch/", {"operations": operations}, format="json")
+        self.assertEqual(response.data["results"], [{"post": self.post.id, "liked": False, "like_count": 0}])
+
+    def test_likers_are_listed_newest_first(self):
+        carol = CustomUser.objects.create_user(username="carol", password="pass12345")
+        self.client.put(self.url)
+        self.client.force_authenticate(carol)
+        self.client.put(self.url)
+
+        response = self.client.get(f"/api/posts/{self.post.id}/likes/")
+        self.assertEqual([u["username"] for u in response.data["results"]], ["carol", "bob"])
+        self.assertEqual(set(response.data["results"][0]), {"id", "username", "avatar", "liked_at"})
+
+
+class TrendingTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.calm = Post.objects.create(author=self.alice, title="Calm", content="Body")
+        self.hot = Post.objects.create(author=self.alice, title="Hot", content="Body")
+
+    def test_trending_orders_by_recent_engagement(self):
+        for name in ("bob", "carol", "dave"):
+            self.client.force_authenticate(CustomUser.objects.create_user(username=name, password="pass12345"))
+            self.client.put(f"/api/posts/{self.hot.id}/like/")
+        self.client.post("/api/comments/", {"post": self.calm.id, "content": "Nice"})
+        # a comment counts for two likes
+        response = self.client.get("/api/posts/trending/", {"window": "hour"})
+        self.assertEqual([p["title"] for p in response.data["results"]], ["Hot", "Calm"])
+
+    def test_old_buckets_are_pruned(self):
+        EngagementBucket.objects.create(post=self.calm, bucket_start=timezone.now() - timedelta(days=3), like_count=5)
+        record_engagement(self.hot.id, likes=1)
+        call_command("prune_engagement_buckets", stdout=StringIO())
+        self.assertEqual(list(EngagementBucket.objects.values_list("post_id", flat=True)), [self.hot.id])
+
+
+class SearchTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.title_hit = Post.objects.create(author=self.alice, title="Gardening tips", content="Water daily")
+        self.body_hit = Post.objects.create(author=self.alice, title="Weekend", content="Did some gardening")
+        self.other = Post.objects.create(author=self.alice, title="Cooking", content="Pasta")
+
+    def search(self, query):
+        seen = []
+        response = self.client.get("/api/posts/", {"search": query, "page_size": 1})
+        while True:
+            seen.extend(p["id"] for p in response.data["results"])
+            if not response.data["next"]:
+                return seen
+            response = self.client.get(response.data["next"])
+
+    def test_results_are_ranked_by_relevance(self):
+        self.assertEqual(self.search("garden"), [self.title_hit.id, self.body_hit.id])
+        self.assertEqual(self.search("alice pasta"), [self.other.id])
+        self.assertEqual(self.search('"unmatched'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.title_hit.title = "Composting"
+        self.title_hit.save()
+        self.body_hit.delete()
+        self.assertEqual(self.search("gardening"), [])
+        self.assertEqual(self.search("composting"), [self.title_hit.id])
+
+    def test_rebuild_command_reindexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM posts_post_search")
+        call_command("rebuild_post_search_index", "--chunk-size", "2", stdout=StringIO())
+        self.assertEqual(len(self.search("alice")), 3)
+
+
+class CommentThreadTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.post = Post.objects.create(author=self.alice, title="Threads", content="Body")
+        self.client.force_authenticate(self.alice)
+
+    def comment(self, content, parent=None):
+        data = {"post": self.post.id, "content": content}
+        if parent:
+            data["parent"] = parent
+        return self.client.post("/api/comments/", data).data["id"]
+
+    def test_tree_is_nested_and_paginated_by_thread(self):
+        first = self.comment("first")
+        reply = self.comment("reply", first)
+        self.comment("nested", reply)
+        second = self.comment("second")
+
+        # the post filter lookup, one page of threads, one range query for their replies
+        hidden_author_ids(self.alice)
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/comments/", {"post": self.post.id, "tree": 1, "page_size": 1})
+        self.assertEqual([c["id"] for c in response.data["results"]], [second])
+
+        response = self.client.get(response.data["next"])
+        (thread,) = response.data["results"]
+        self.assertEqual(thread["replies"][0]["content"], "reply")
+        self.assertEqual(thread["replies"][0]["replies"][0]["content"], "nested")
+
+        subtree = self.client.get("/api/comments/", {"post": self.post.id, "tree": 1, "thread": reply}).data
+        self.assertEqual((subtree["id"], len(subtree["replies"])), (reply, 1))
+
+        subtree = self.client.get("/api/comments/", {"tree": 1, "thread": reply}).data
+        self.assertEqual((subtree["id"], len(subtree["replies"])), (reply, 1))
+
+    def test_thread_must_be_a_comment_id(self):
+        response = self.client.get("/api/comments/", {"tree": 1, "thread": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleting_a_thread_removes_its_replies_from_the_count(self):
+        first = self.comment("first")
+        self.comment("reply", self.comment("reply", first))
+        self.client.delete(f"/api/comments/{first}/")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_reply_must_be_on_the_same_post(self):
+        other = Post.objects.create(author=self.alice, title="Other", content="Body")
+        parent = self.comment("first")
+        response = self.client.post("/api/comments/", {"post": other.id, "content": "x", "parent": parent})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_comment_cannot_move_to_another_post(self):
+        other = Post.objects.create(author=self.alice, title="Other", content="Body")
+        first = self.comment("first")
+        self.comment("reply", first)
+        response = self.client.patch(f"/api/comments/{first}/", {"post": other.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f"/api/comments/{first}/", {"post": self.post.id, "content": "edited"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 2)
+
+
+class RecentCommentsTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.posts = [Post.objects.create(author=self.alice, title=f"Post {i}", content="Body") for i in range(2)]
+        for post in self.posts:
+            for i in range(4):
+                Comment.objects.create(post=post, author=self.alice, content=f"{post.title} comment {i}")
+
+    def test_recent_comments_are_embedded_with_one_query(self):
+        # the post page plus one windowed comment query
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/posts/", {"include": "recent_comments"})
+        for data in response.data["results"]:
+            self.assertEqual(
+                [c["content"] for c in data["recent_comments"]],
+                [f"{data['title']} comment {i}" for i in (3, 2, 1)],
+            )
+
+    def test_hidden_comments_dont_take_the_embedded_slots(self):
+        bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        for i in range(3):
+            Comment.objects.create(post=self.posts[0], author=bob, content=f"Bob {i}")
+        self.alice.muted.add(bob)
+        self.client.force_authenticate(self.alice)
+        response = self.client.get("/api/posts/", {"include": "recent_comments"})
+        data = next(d for d in response.data["results"] if d["id"] == self.posts[0].id)
+        self.assertEqual(
+            [c["content"] for c in data["recent_comments"]],
+            [f"Post 0 comment {i}" for i in (3, 2, 1)],
+        )
+
+    def test_recent_comments_are_opt_in(self):
+        response = self.client.get("/api/posts/")
+        self.assertNotIn("recent_comments", response.data["results"][0])
+
+
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.post = Post.objects.create(author=self.alice, title="Sparse", content="A long body")
+
+    def test_fields_trim_output_and_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/posts/", {"fields": "id,title"})
+        self.assertEqual(response.data["results"], [{"id": self.post.id, "title": "Sparse"}])
+        sql = queries[0]["sql"]
+        self.assertNotIn('"content"', sql)
+        self.assertNotIn("accounts_customuser", sql)
+
+    def test_omit_keeps_the_join_when_needed(self):
+        response = self.client.get("/api/posts/", {"omit": "content"})
+        post = response.data["results"][0]
+        self.assertNotIn("content", post)
+        self.assertEqual(post["author_username"], "alice")
+
+
+class PaginationTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.posts = [
+            Post.objects.create(author=self.alice, title=f"Post {i}", content="Body") for i in range(5)
+        ]
+
+    def test_posts_page_by_cursor_without_count(self):
+        seen = []
+        url = "/api/posts/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn("count", response.data)
+            seen.extend(p["id"] for p in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, [p.id for p in reversed(self.posts)])
+
+
+class CompiledSerializerTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/follow/{self.bob.id}/")
+        self.client.force_authenticate(self.bob)
+        for i in range(3):
+            self.client.post("/api/posts/", {"title": f"Post {i}", "content": "Body"})
+        self.post = Post.objects.latest("id")
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/api/posts/{self.post.id}/like/")
+        self.client.post("/api/comments/", {"post": self.post.id, "content": "Nice"})
+
+    def assertSameContent(self, url, params=None):
+        cache.clear()
+        compiled = self.client.get(url, params)
+        cache.clear()
+        with override_settings(COMPILED_SERIALIZERS=False):
+            regular = self.client.get(url, params)
+        self.assertEqual(compiled.status_code, status.HTTP_200_OK)
+        self.assertEqual(compiled.content, regular.content)
+
+    def test_compiled_output_is_byte_identical(self):
+        self.assertSameContent("/api/posts/")
+        self.assertSameContent("/api/posts/", {"fields": "id,liked_by_me,created_at"})
+        self.assertSameContent("/api/comments/", {"post": self.post.id})
+        self.assertSameContent(reverse("feed"))
+        self.assertSameContent(reverse("feed"), {"ranking": "engagement"})
+
+    def test_nested_includes_fall_back_to_the_serializer(self):
+        self.assertSameContent("/api/posts/", {"include": "recent_comments"})
+        response = self.client.get("/api/posts/", {"include": "recent_comments"})
+        self.assertEqual(response.data["results"][0]["recent_comments"][0]["content"], "Nice")
+
+
+class FeedChangesTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/follow/{self.bob.id}/")
+        self.cursor = self.client.get("/api/feed/changes/").data["cursor"]
+
+    def changes(self):
+        self.client.force_authenticate(self.alice)
+        response = self.client.get("/api/feed/changes/", {"since": self.cursor})
+        self.cursor = response.data["cursor"]
+        return response.data
+
+    def as_bob(self, method, url, data=None):
+        self.client.force_authenticate(self.bob)
+        return getattr(self.client, method)(url, data)
+
+    def test_new_and_edited_posts_are_returned_once(self):
+        post_id = self.as_bob("post", "/api/posts/", {"title": "Hi", "content": "Hello"}).data["id"]
+        self.assertEqual([p["id"] for p in self.changes()["posts"]], [post_id])
+        self.assertEqual(self.changes()["posts"], [])
+
+        self.as_bob("patch", f"/api/posts/{post_id}/", {"title": "Edited"})
+        self.assertEqual([p["title"] for p in self.changes()["posts"]], ["Edited"])
+
+    def test_unchanged_poll_is_a_single_query(self):
+        self.changes()
+        with self.assertNumQueries(1):
+            data = self.changes()
+        self.assertEqual(data["posts"], [])
+        self.assertEqual(data["tombstones"], [])
+
+    def test_deletes_and_unfollows_leave_tombstones(self):
+        post_id = self.as_bob("post", "/api/posts/", {"title": "Hi", "content": "Hello"}).data["id"]
+        self.changes()
+        self.as_bob("delete", f"/api/posts/{post_id}/")
+        self.assertEqual(self.changes()["tombstones"], [{"post": post_id, "author": self.bob.id}])
+
+        self.client.post(f"/accounts/unfollow/{self.bob.id}/")
+        self.assertEqual(self.changes()["tombstones"], [{"post": None, "author": self.bob.id}])
+
+    def test_a_follow_resets_older_cursors(self):
+        carol = CustomUser.objects.create_user(username="carol", password="pass12345")
+        Post.objects.create(author=carol, title="Old", content="Body")
+        self.client.post(f"/accounts/follow/{carol.id}/")
+        # the backfilled post is older than the cursor, so it can't come as a change
+        response = self.client.get("/api/feed/changes/", {"since": self.cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual([p["title"] for p in self.client.get(reverse("feed")).data["results"]], ["Old"])
+
+        self.cursor = self.client.get("/api/feed/changes/").data["cursor"]
+        self.assertEqual(self.changes()["posts"], [])
+
+    def test_expired_cursor_is_gone(self):
+        with override_settings(FEED_TOMBSTONE_RETENTION_DAYS=0):
+            response = self.client.get("/api/feed/changes/", {"since": self.cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        response = self.client.get("/api/feed/changes/", {"since": "garbage"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_naive_cursor_times_are_rejected(self):
+        naive = decode_cursor(self.cursor)._replace(issued_at=datetime(2026, 1, 1))
+        response = self.client.get("/api/feed/changes/", {"since": encode_cursor(naive)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkCreateTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", password="pass12345")
+        self.client.force_authenticate(self.bob)
+        self.client.post(f"/accounts/follow/{self.alice.id}/")
+        self.client.force_authenticate(self.alice)
+
+    def test_bulk_create_fans_out_and_indexes_once(self):
+        items = [{"title": f"Import {i}", "content": "Imported"} for i in range(3)]
+        response = self.client.post("/api/posts/bulk/", items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ids = [p["id"] for p in response.data]
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(response.data[0]["author_username"], "alice")
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.bob).values_list("post_id", flat=True)), set(ids)
+        )
+        found = self.client.get("/api/posts/", {"search": "import"}).data["results"]
+        self.assertEqual(len(found), 3)
+
+    def test_invalid_items_reject_the_whole_batch(self):
+        items = [{"title": "Fine", "content": "Body"}, {"title": "x" * 51, "content": "Body"}]
+        response = self.client.post("/api/posts/bulk/", items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("title", response.data[1])
+        self.assertFalse(Post.objects.exists())
+
+
+@override_settings(SNOWFLAKE_IDS=True)
+class SnowflakeIdTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.client.force_authenticate(self.alice)
+
+    def test_ids_are_unique_and_time_ordered(self):
+        generator = snowflake.SnowflakeGenerator(node_id=3)
+        ids = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertLess(abs(snowflake.created_at(ids[-1]) - timezone.now()), timedelta(seconds=5))
+        self.assertGreaterEqual(ids[0], snowflake.id_at(timezone.now() - timedelta(seconds=5)))
+
+    def test_each_process_leases_its_own_node_id(self):
+        cache.clear()
+        self.addCleanup(setattr, snowflake, '_lease', None)
+        parent_node, parent_token = snowflake.lease_node_id()
+        # a worker forked from the parent, which still holds its lease
+        snowflake._lease = snowflake.Lease(os.getpid() + 1, parent_node, parent_token, time.monotonic())
+        node = snowflake.node_id()
+        self.assertNotEqual(node, parent_node)
+        self.assertEqual(snowflake.node_id(), node)
+
+        # a lease that lapsed and was taken by another process is replaced
+        lapsed = snowflake._lease._replace(renewed_at=time.monotonic() - snowflake.NODE_LEASE_SECONDS)
+        snowflake._lease = lapsed
+        cache.set(snowflake._lease_key(node), "someone else")
+        self.assertNotIn(snowflake.node_id(), (node, parent_node))
+
+    def test_models_take_snowflake_ids(self):
+        with override_settings(SNOWFLAKE_IDS=False):
+            legacy = Post.objects.create(author=self.alice, title="Legacy", content="Body")
+        post_id = self.client.post("/api/posts/", {"title": "New", "content": "Body"}).data["id"]
+        self.client.post("/api/comments/", {"post": post_id, "content": "Hi"})
+        bulk_ids = [p["id"] for p in self.client.post(
+            "/api/posts/bulk/", [{"title": "Bulk", "content": "Body"}], format="json"
+        ).data]
+
+        self.assertGreater(int(post_id), legacy.id)
+        self.assertGreater(int(bulk_ids[0]), int(post_id))
+        self.assertGreater(Comment.objects.get().id, snowflake.id_at(timezone.now() - timedelta(minutes=1)))
+
+        response = self.client.get("/api/posts/", {"page_size": 2})
+        self.assertEqual([p["id"] for p in response.data["results"]], [bulk_ids[0], post_id])
+        response = self.client.get(response.data["next"])
+        self.assertEqual([p["id"] for p in response.data["results"]][0], str(legacy.id))
+
+    def test_ids_are_rendered_as_strings(self):
+        post_id = self.client.post("/api/posts/", {"title": "New", "content": "Body"}).data["id"]
+        self.assertIsInstance(post_id, str)
+        self.assertGreater(int(post_id), 2 ** 53)
+        comment = self.client.post("/api/comments/", {"post": post_id, "content": "Hi"}).data
+        reply = self.client.post("/api/comments/", {"post": post_id, "content": "Re", "parent": comment["id"]}).data
+        self.assertEqual((reply["post"], reply["parent"]), (post_id, comment["id"]))
+        self.assertIsInstance(reply["id"], str)
+
+        # the compiled list path and embedded comments render them the same way
+        cache.clear()
+        post = self.client.get("/api/posts/", {"include": "recent_comments"}).data["results"][0]
+        self.assertEqual(post["id"], post_id)
+        self.assertEqual({c["post"] for c in post["recent_comments"]}, {post_id})
+        self.assertEqual(self.client.get("/api/comments/", {"post": post_id}).data["results"][0]["post"], post_id)
+        self.assertEqual(self.client.get(f"/api/posts/{post_id}/").data["id"], post_id)
+
+
+class HashtagTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.client.force_authenticate(self.alice)
+
+    def create(self, content):
+        return self.client.post("/api/posts/", {"title": "Tagged", "content": content}).data["id"]
+
+    def test_hashtags_are_extracted_and_kept_in_sync(self):
+        self.assertEqual(
+            extract_hashtags("#Django and #django, #2024 not, a#b not, #café_1 yes"), ["django", "café_1"]
+        )
+        post_id = self.create("Shipping #Django #python")
+        self.assertEqual(sorted(Post.objects.get(id=post_id).tags.names()), ["django", "python"])
+        self.client.patch(f"/api/posts/{post_id}/", {"content": "Only #python now"})
+        self.assertEqual(list(Post.objects.get(id=post_id).tags.names()), ["python"])
+        self.client.post("/api/posts/bulk/", [{"title": "Bulk", "content": "#python again"}], format="json")
+        self.assertEqual(TaggedPost.objects.filter(tag__slug="python").count(), 2)
+
+    def test_tag_timeline_pages_newest_first(self):
+        ids = [self.create(f"Post {i} #news") for i in range(3)]
+        self.create("Untagged")
+        seen = []
+        url = "/api/tags/NEWS/posts/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            seen.extend(p["id"] for p in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, ids[::-1])
+        self.assertEqual(self.client.get("/api/tags/missing/posts/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_top_tags_are_cached(self):
+        self.create("#a #b")
+        self.create("#b")
+        self.assertEqual(
+            self.client.get("/api/tags/top/").data["results"], [{"tag": "b", "posts": 2}, {"tag": "a", "posts": 1}]
+        )
+        self.create("#a #a")
+        with self.assertNumQueries(0):
+            self.client.get("/api/tags/top/")
+
+
+class MentionTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", password="pass12345")
+        self.users = [CustomUser.objects.create_user(username=f"user.{i}", password=None) for i in range(50)]
+        self.client.force_authenticate(self.alice)
+        self.post = Post.objects.create(author=self.alice, title="Hi", content="Body")
+
+    def test_mentions_resolve_and_notify_in_two_queries(self):
+        self.assertEqual(extract_mentions("hey @bob. @carol-1, me@mail.com @bob"), ["bob", "carol-1"])
+        comment = Comment.objects.create(post=self.post, author=self.alice, content="x")
+        text = " ".join(f"@{user.username}" for user in self.users) + " @alice @nobody"
+        ContentType.objects.get_for_model(Comment)
+        with self.assertNumQueries(2):
+            notify_mentions(self.alice, [(text, comment)], "mentioned you in a comment")
+        self.assertEqual(Notification.objects.filter(verb="mentioned you in a comment").count(), 50)
+
+    def test_posts_and_comments_notify_mentioned_users(self):
+        self.client.post("/api/posts/", {"title": "Hi", "content": "cc @user.1"})
+        self.client.post("/api/comments/", {"post": self.post.id, "content": "@user.2 look"})
+        self.assertEqual(
+            sorted(Notification.objects.values_list("recipient__username", "verb")),
+            [("user.1", "mentioned you in a post"), ("user.2", "mentioned you in a comment")],
+        )
+
+
+class MuteBlockTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.alice, self.bob, self.carol = [
+            CustomUser.objects.create_user(username=name, password="pass12345") for name in ("alice", "bob", "carol")
+        ]
+        self.posts = {}
+        for user in (self.bob, self.carol):
+            self.client.force_authenticate(self.alice)
+            self.client.post(f"/accounts/follow/{user.id}/")
+            self.client.force_authenticate(user)
+            self.posts[user] = self.client.post("/api/posts/", {"title": "Hi", "content": "Body"}).data["id"]
+        self.client.force_authenticate(self.alice)
+
+    def authors(self, url, params=None):
+        return {p["author"] for p in self.client.get(url, params).data["results"]}
+
+    def test_muted_and_blocking_users_are_filtered_out(self):
+        self.client.post(f"/accounts/mute/{self.bob.id}/")
+        self.client.force_authenticate(self.carol)
+        self.client.post(f"/accounts/block/{self.alice.id}/")
+        self.client.force_authenticate(self.alice)
+
+        self.assertEqual(self.authors("/api/posts/"), set())
+        self.assertEqual(self.authors(reverse("feed")), set())
+        self.assertEqual(self.authors(reverse("feed"), {"ranking": "engagement"}), set())
+
+        self.client.post(f"/accounts/unmute/{self.bob.id}/")
+        self.assertEqual(self.authors("/api/posts/"), {self.bob.id})
+        self.assertEqual(self.authors(reverse("feed")), {self.bob.id})
+
+    def test_embeds_and_feed_changes_are_filtered_too(self):
+        cursor = self.client.get("/api/feed/changes/").data["cursor"]
+        self.client.force_authenticate(self.bob)
+        self.client.post("/api/comments/", {"post": self.posts[self.carol], "content": "From bob"})
+        self.client.patch(f"/api/posts/{self.posts[self.bob]}/", {"title": "Edited"})
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/block/{self.bob.id}/")
+
+        response = self.client.get("/api/posts/", {"include": "recent_comments"})
+        (carol_post,) = response.data["results"]
+        self.assertEqual(carol_post["recent_comments"], [])
+        changes = self.client.get("/api/feed/changes/", {"since": cursor}).data
+        self.assertEqual({p["author"] for p in changes["posts"]}, set())
+
+    def test_hidden_comments_take_their_replies_along(self):
+        post = self.posts[self.bob]
+        self.client.force_authenticate(self.bob)
+        root = self.client.post("/api/comments/", {"post": post, "content": "root"}).data["id"]
+        self.client.force_authenticate(self.carol)
+        muted = self.client.post("/api/comments/", {"post": post, "parent": root, "content": "muted"}).data["id"]
+        self.client.force_authenticate(self.bob)
+        self.client.post("/api/comments/", {"post": post, "parent": muted, "content": "under muted"})
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/mute/{self.carol.id}/")
+
+        self.assertEqual(self.authors("/api/comments/", {"post": post}), {self.bob.id})
+        (thread,) = self.client.get("/api/comments/", {"post": post, "tree": 1}).data["results"]
+        self.assertEqual(thread["replies"], [])
+        response = self.client.get("/api/comments/", {"post": post, "tree": 1, "thread": muted})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(
+    len(settings.POST_SHARDS) >= 2,
+    "set SNOWFLAKE_IDS=True, SNOWFLAKE_NODE_ID=0 and DATABASE_URL_SHARD_0, DATABASE_URL_SHARD_1 (e.g. sqlite files) to run",
+)
+@override_settings(READ_REPLICAS=[])
+class ShardingTests(APITestCase):
+    databases = {'default', *settings.POST_SHARDS}
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password=None)
+        # two authors whose posts land on different shards
+        self.bob = CustomUser.objects.create_user(username="bob", password=None)
+        self.carol = CustomUser.objects.create_user(username="carol0", password=None)
+        while sharding.shard_for_author(self.carol.id) == sharding.shard_for_author(self.bob.id):
+            self.carol = CustomUser.objects.create_user(username=f"carol{self.carol.id}", password=None)
+
+    def post_as(self, user, title):
+        self.client.force_authenticate(user)
+        response = self.client.post("/api/posts/", {"title": title, "content": "Body"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def test_posts_comments_and_likes_live_on_the_author_shard(self):
+        bob_post = self.post_as(self.bob, "Bob's")
+        carol_post = self.post_as(self.carol, "Carol's")
+        self.client.force_authenticate(self.alice)
+        self.client.post("/api/comments/", {"post": bob_post, "content": "Nice"})
+        self.client.post(f"/api/posts/{bob_post}/like/")
+
+        bob_shard = sharding.shard_for_author(self.bob.id)
+        carol_shard = sharding.shard_for_author(self.carol.id)
+        self.assertTrue(Post.objects.using(bob_shard).filter(pk=bob_post).exists())
+        self.assertTrue(Post.objects.using(carol_shard).filter(pk=carol_post).exists())
+        self.assertEqual(str(Comment.objects.using(bob_shard).get().post_id), bob_post)
+        self.assertTrue(Post.objects.using(bob_shard).get(pk=bob_post).likes.exists())
+        self.assertFalse(Post.objects.using('default').exists())
+
+        # lookups without a database go to every shard
+        response = self.client.get(f"/api/posts/{bob_post}/")
+        self.assertEqual((response.data["like_count"], response.data["comment_count"]), (1, 1))
+        self.assertEqual(response.data["author_username"], self.bob.username)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(self.client.get(f"/api/posts/{carol_post}/").data["title"], "Carol's")
+
+    @override_settings(FEED_FANOUT_FOLLOWER_LIMIT=1)
+    def test_feed_merges_timeline_and_shards_newest_first(self):
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/follow/{self.bob.id}/")
+        self.client.post(f"/accounts/follow/{self.carol.id}/")
+        # carol's posts are pulled from her shard at read time
+        CustomUser.objects.filter(pk=self.carol.pk).update(follower_count=2)
+        titles = ["b1", "c1", "b2", "c2", "b3"]
+        for title in titles:
+            self.post_as(self.bob if title[0] == "b" else self.carol, title)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.alice).count(), 3)
+
+        self.client.force_authenticate(self.alice)
+        response = self.client.get(reverse("feed"), {"page_size": 3})
+        self.assertEqual([p["title"] for p in response.data["results"]], ["b3", "c2", "b2"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual([p["title"] for p in response.data["results"]], ["c1", "b1"])
+        self.assertIsNone(response.data["next"])
+
+    def test_lists_and_exports_merge_across_shards(self):
+        titles = ["b1", "c1", "b2", "c2"]
+        ids = {title: self.post_as(self.bob if title[0] == "b" else self.carol, title) for title in titles}
+        self.client.force_authenticate(self.alice)
+        for title in ("b1", "c1"):
+            self.client.post("/api/comments/", {"post": ids[title], "content": f"On {title}"})
+        self.client.put(f"/api/posts/{ids['b1']}/like/")
+        self.client.force_authenticate(self.carol)
+        self.client.put(f"/api/posts/{ids['b1']}/like/")
+        self.client.force_authenticate(self.alice)
+
+        response = self.client.get("/api/posts/", {"page_size": 3})
+        self.assertEqual([p["title"] for p in response.data["results"]], ["c2", "b2", "c1"])
+        self.assertEqual(response.data["results"][0]["author_username"], self.carol.username)
+        response = self.client.get(response.data["next"])
+        self.assertEqual([p["title"] for p in response.data["results"]], ["b1"])
+        self.assertEqual(len(self.client.get("/api/posts/", {"search": "c1"}).data["results"]), 1)
+
+        response = self.client.get("/api/comments/", {"post": ids["c1"]})
+        self.assertEqual([c["content"] for c in response.data["results"]], ["On c1"])
+        response = self.client.get(f"/api/posts/{ids['b1']}/likes/")
+        self.assertEqual([u["username"] for u in response.data["results"]], [self.carol.username, "alice"])
+
+        lines = [json.loads(line) for line in export_lines(self.alice)]
+        self.assertEqual(
+            sorted((line["type"], line["post_id"]) for line in lines if line["type"] in ("comment", "like")),
+            sorted([("comment", ids["b1"]), ("comment", ids["c1"]), ("like", ids["b1"])]),
+        )
+        lines = [json.loads(line) for line in export_lines(self.carol)]
+        self.assertEqual([line["title"] for line in lines if line["type"] == "post"], ["c1", "c2"])
+
+    def test_unfollow_and_user_deletion_reach_the_author_shard(self):
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/follow/{self.bob.id}/")
+        self.client.post(f"/accounts/follow/{self.carol.id}/")
+        self.post_as(self.bob, "b1")
+        self.post_as(self.carol, "c1")
+        self.client.force_authenticate(self.alice)
+        self.client.post(f"/accounts/unfollow/{self.bob.id}/")
+        response = self.client.get(reverse("feed"))
+        self.assertEqual([p["title"] for p in response.data["results"]], ["c1"])
+        response = self.client.get(reverse("feed"), {"ranking": "engagement"})
+        self.assertEqual([p["title"] for p in response.data["results"]], ["c1"])
+
+        self.carol.delete()
+        self.assertFalse(Post.objects.filter(author_id=self.carol.id).exists())
+
+    @override_settings(POST_COUNTER_SHARDS=4)
+    def test_recount_repairs_counts_on_each_shard(self):
+        ids = {"b1": self.post_as(self.bob, "b1"), "c1": self.post_as(self.carol, "c1")}
+        self.client.force_authenticate(self.alice)
+        for pk in ids.values():
+            self.client.post(f"/api/posts/{pk}/like/")
+            self.client.post("/api/comments/", {"post": pk, "content": "Nice"})
+        self.assertTrue(PostCounterShard.objects.exists())
+        Post.objects.filter(pk=ids["c1"]).update(like_count=7)
+
+        out = StringIO()
+        call_command("recount_post_stats", stdout=out)
+        self.assertIn("Checked 2 posts, repaired 2.", out.getvalue())
+        self.assertFalse(PostCounterShard.objects.exists())
+        for pk in ids.values():
+            post = Post.objects.get(pk=pk)
+            self.assertEqual((post.like_count, post.comment_count), (1, 1))
+
+    def test_rebuild_drops_index_rows_of_posts_gone_from_their_shard(self):
+        ids = [self.post_as(self.bob, "b1"), self.post_as(self.carol, "c1"), self.post_as(self.carol, "c2")]
+        # a raw delete on the shard skips the signals and leaves the index row behind
+        with connections[sharding.shard_for_author(self.carol.id)].cursor() as cursor:
+            cursor.execute("DELETE FROM posts_post WHERE id = %s", [ids[1]])
+        call_command("rebuild_post_search_index", stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM posts_post_search ORDER BY rowid")
+            self.assertEqual([str(row[0]) for row in cursor.fetchall()], sorted([ids[0], ids[2]], key=int))
+
+
+@skipUnless(settings.READ_REPLICAS, "set DATABASE_URL_REPLICA_0 (e.g. a sqlite file) to run")
+@override_settings(POST_SHARDS=[])
+class ReadReplicaTests(APITestCase):
+    databases = {'default', *settings.READ_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password=None)
+        token = Token.objects.create(user=self.alice)
+        # stands in for replication: the replicas know alice and her token, no posts yet
+        for alias in settings.READ_REPLICAS:
+            self.alice.save(using=alias, force_insert=True)
+            token.save(using=alias, force_insert=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def titles(self):
+        return [p["title"] for p in self.client.get("/api/posts/").data["results"]]
+
+    def test_reads_use_replicas_unless_the_client_just_wrote(self):
+        Post.objects.create(author=self.alice, title="Primary", content="Body")
+        self.assertEqual(self.titles(), [])
+        for alias in settings.READ_REPLICAS:
+            Post.objects.using(alias).create(author=self.alice, title="Replica", content="Body")
+        self.assertEqual(self.titles(), ["Replica"])
+
+        self.client.post("/api/posts/", {"title": "New", "content": "Body"})
+        self.assertEqual(self.titles(), ["New", "Primary"])
+
+        cache.clear()  # the pin has expired
+        self.assertEqual(self.titles(), ["Replica"])
+
+    def test_new_tokens_are_pinned_to_the_primary(self):
+        client = APIClient()
+        response = client.post("/accounts/register/", {"username": "bob", "password": "secret-pw-1"})
+        client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        # bob and his token haven't reached the replicas yet
+        self.assertEqual(client.get("/api/posts/").status_code, 200)
+
+        cache.clear()
+        self.assertEqual(client.get("/api/posts/").status_code, 401)
+        APIClient().post("/accounts/login/", {"username": "bob", "password": "secret-pw-1"})
+        self.assertEqual(client.get("/api/posts/").status_code, 200)
+
+    def test_the_middleware_runs_natively_under_asgi(self):
+        # with DEBUG on, each middleware adapted to sync is logged
+        with self.settings(DEBUG=True), self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+        client = AsyncClient()
+        response = async_to_sync(client.post)(
+            "/accounts/register/", {"username": "bob", "password": "secret-pw-1"}, content_type="application/json",
+        )
+        headers = {"Authorization": f"Token {json.loads(response.content)['token']}"}
+        self.assertEqual(async_to_sync(client.get)("/api/posts/", headers=headers).status_code, 200)
+        cache.clear()
+        self.assertEqual(async_to_sync(client.get)("/api/posts/", headers=headers).status_code, 401)
+
+    def test_cached_feed_data_is_read_from_the_primary(self):
+        bob = CustomUser.objects.create_user(username="bob", password=None)
+        self.alice.following.add(bob)
+        cursor = self.client.get(reverse("feed-changes")).data["cursor"]
+        self.assertEqual(self.client.get(reverse("feed")).data["results"], [])
+
+        # bob's client isn't alice's, so she isn't pinned; the replicas have neither the post nor the timeline row
+        author = APIClient()
+        author.force_authenticate(bob)
+        author.post("/api/posts/", {"title": "New", "content": "Body"})
+        response = self.client.get(reverse("feed"))
+        self.assertEqual([p["title"] for p in response.data["results"]], ["New"])
+        response = self.client.get(reverse("feed-changes"), {"since": cursor})
+        self.assertEqual([p["title"] for p in response.data["posts"]], ["New"])
+
+    def test_objects_read_from_a_replica_are_saved_to_the_primary(self):
+        with replica_reads():
+            user = CustomUser.objects.get(pk=self.alice.pk)
+        replica = user._state.db
+        self.assertIn(replica, settings.READ_REPLICAS)
+        user.bio = "Updated"
+        user.save()
+        self.assertEqual(CustomUser.objects.using('default').get(pk=self.alice.pk).bio, "Updated")
+        self.assertEqual(CustomUser.objects.using(replica).get(pk=self.alice.pk).bio, "")
+
+
+class AsyncFeedTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password=None)
+        self.bob = CustomUser.objects.create_user(username="bob", password=None)
+        for i in range(5):
+            Post.objects.create(author=self.bob, title=f"Post {i}", content="Body")
+        self.token = Token.objects.create(user=self.alice)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.client.post(f"/accounts/follow/{self.bob.id}/")
+
+    def get_async(self, url, params=None, token=None):
+        token = self.token.key if token is None else token
+        request = APIRequestFactory().get(url, params, HTTP_AUTHORIZATION=f"Token {token}" if token else "")
+        return async_to_sync(AsyncFeedView.as_view())(request)
+
+    def test_async_feed_matches_the_sync_feed(self):
+        for params in ({"page_size": 2}, {"fields": "id,title"}, {"ranking": "engagement"}):
+            cache.clear()
+            expected = self.client.get(reverse("feed"), params).json()
+            cache.clear()
+            response = self.get_async(reverse("feed"), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(response.content), expected)
+
+        cache.clear()
+        self.assertEqual(self.get_async(reverse("feed"))["X-Feed-Cache"], "miss")
+        with self.assertNumQueries(2):  # the token and the celebrity lookup, the page comes from the cache
+            self.assertEqual(self.get_async(reverse("feed"))["X-Feed-Cache"], "hit")
+
+        cache.clear()
+        page = json.loads(self.get_async(reverse("feed"), {"page_size": 2}).content)
+        response = self.get_async(page["next"])
+        self.assertEqual([p["title"] for p in json.loads(response.content)["results"]], ["Post 2", "Post 1"])
+
+    def test_async_feed_requires_a_valid_token(self):
+        response = self.get_async(reverse("feed"), token="")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response["WWW-Authenticate"], "Token")
+        response = self.get_async(reverse("feed"), token="nope")
+        self.assertEqual(json.loads(response.content), {"detail": "Invalid token."})
+
+
+class IdempotencyTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", password=None)
+        self.bob = CustomUser.objects.create_user(username="bob", password=None)
+        self.client.force_authenticate(self.alice)
+
+    def test_retries_replay_the_first_response(self):
+        first = self.client.post("/api/posts/", {"title": "Hi", "content": "Body"}, HTTP_IDEMPOTENCY_KEY="p1")
+        with self.assertNumQueries(0):
+            retry = self.client.post("/api/posts/", {"title": "Hi", "content": "Body"}, HTTP_IDEMPOTENCY_KEY="p1")
+        self.assertEqual((retry.status_code, retry.data), (status.HTTP_201_CREATED, first.data))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Post.objects.count(), 1)
+
+        post = Post.objects.create(author=self.bob, title="Bob's", content="Body")
+        for _ in range(2):
+            comment = self.client.post("/api/comments/", {"post": post.id, "content": "Nice"}, HTTP_IDEMPOTENCY_KEY="c1")
+            like = self.client.post(f"/api/posts/{post.id}/like/", HTTP_IDEMPOTENCY_KEY="l1")
+            self.assertEqual((comment.status_code, like.status_code), (201, 201))
+        post.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count), (1, 1))
+        self.assertEqual(Notification.objects.filter(recipient=self.bob).count(), 2)
+
+        # without a key, or with a new one, the view runs as before
+        self.assertEqual(self.client.post(f"/api/posts/{post.id}/like/").status_code, 400)
+        self.client.post("/api/posts/", {"title": "Hi", "content": "Body"}, HTTP_IDEMPOTENCY_KEY="p2")
+        self.assertEqual(Post.objects.filter(author=self.alice).count(), 2)
+
+    def test_reusing_a_key_for_a_different_request_is_rejected(self):
+        self.client.post("/api/posts/", {"title": "Hi", "content": "Body"}, HTTP_IDEMPOTENCY_KEY="p1")
+        response = self.client.post("/api/posts/", {"title": "Other", "content": "Body"}, HTTP_IDEMPOTENCY_KEY="p1")
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Post.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=2)
+    def test_duplicates_wait_for_the_request_in_flight(self):
+        _, lock_key = cache_keys(self.alice.id, "/api/posts/", "p1")
+        cache.add(lock_key, True)
+        with override_settings(IDEMPOTENCY_WAIT_SECONDS=0.1):
+            response = self.client.post("/api/posts/", {"title": "Hi", "content": "Body"}, HTTP_IDEMPOTENCY_KEY="p1")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Post.objects.exists())
+
+        # the first request gives up its claim without a response, so the waiting one runs
+        threading.Timer(0.1, cache.delete, [lock_key]).start()
+        response = self.client.post("/api/posts/", {"title": "Hi", "content": "Body"}, HTTP_IDEMPOTENCY_KEY="p1")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Post.objects.count(), 1)
 
-# Create your tests here.
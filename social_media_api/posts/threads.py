@@ -0,0 +1,47 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+
+def subtree(comments, roots):
+    """All comments under the given roots, roots included, in one prefix-range query."""
+    if not roots:
+        return comments.none()
+    # scoped to the post so each range is served by the (post, path) index
+    prefixes = reduce(or_, (Q(post_id=root.post_id, path__startswith=root.path) for root in roots))
+    return comments.filter(prefixes).order_by('path')
+
+
+def build_tree(comments, rows):
+    """Nest serialized comments under their parents in one pass over path-ordered rows.
+
+    comments and rows are the same comments as instances and as serialized
+    data. Comments whose parent isn't among them (the requested roots) come
+    back as the top level, as (comment, node) pairs.
+    """
+    nodes = {}
+    roots = []
+    for comment, row in zip(comments, rows):
+        node = {**row, 'replies': []}
+        nodes[comment.id] = node
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            roots.append((comment, node))
+        else:
+            parent['replies'].append(node)
+    return roots
+
+
+def without_orphans(comments, roots):
+    """Drop comments not connected to a root, e.g. replies under a hidden comment.
+
+    comments are in path order, as subtree() returns them.
+    """
+    kept_ids = {root.id for root in roots}
+    kept = []
+    for comment in comments:
+        if comment.id in kept_ids or comment.parent_id in kept_ids:
+            kept_ids.add(comment.id)
+            kept.append(comment)
+    return kept
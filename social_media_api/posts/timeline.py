@@ -0,0 +1,162 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+from accounts.models import CustomUser
+from social_media_api import sharding
+from social_media_api.sharding import merge_newest, shard_for_author
+from .models import FeedTombstone, Post, TimelineEntry
+
+BATCH_SIZE = 1000
+
+Follow = CustomUser.following.through
+
+
+def fanout_limit():
+    return settings.FEED_FANOUT_FOLLOWER_LIMIT
+
+
+def _celebrities(user):
+    return user.following.filter(follower_count__gt=fanout_limit()).values_list('id', flat=True)
+
+
+def celebrity_ids(user):
+    """Ids of followed authors whose posts are pulled at read time."""
+    return list(_celebrities(user))
+
+
+async def acelebrity_ids(user):
+    return [pk async for pk in _celebrities(user)]
+
+
+def _bulk_insert(entries):
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out_posts(posts):
+    """Copy new posts into the timelines of their authors' followers."""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+
+    # high-follower authors are skipped, their posts are merged in by timeline_posts()
+    author_ids = CustomUser.objects.filter(
+        id__in=by_author, follower_count__lte=fanout_limit()
+    ).values_list('id', flat=True)
+
+    for author_id in author_ids:
+        follower_ids = Follow.objects.filter(to_customuser_id=author_id).values_list(
+            'from_customuser_id', flat=True
+        )
+        entries = []
+        for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+            entries.extend(
+                TimelineEntry(user_id=follower_id, post_id=post.id, created_at=post.created_at)
+                for post in by_author[author_id]
+            )
+            if len(entries) >= BATCH_SIZE:
+                _bulk_insert(entries)
+                entries = []
+        if entries:
+            _bulk_insert(entries)
+
+
+def backfill_timeline(user, author):
+    """Copy an author's recent posts into a new follower's timeline."""
+    if author.follower_count > fanout_limit():
+        return
+    recent = author.posts.order_by('-created_at').values_list('id', 'created_at')
+    _bulk_insert([
+        TimelineEntry(user=user, post_id=post_id, created_at=created_at)
+        for post_id, created_at in recent[:settings.FEED_BACKFILL_LIMIT]
+    ])
+
+
+def trim_timeline(user, author):
+    """Drop an author's posts from a former follower's timeline."""
+    entries = TimelineEntry.objects.filter(user=user)
+    if sharding.enabled():
+        # the author's posts can't be joined from here, look the timeline's post ids up on their shard
+        post_ids = list(entries.values_list('post_id', flat=True))
+        authored = Post.objects.using(shard_for_author(author.id)).filter(author_id=author.id)
+        doomed = []
+        for start in range(0, len(post_ids), BATCH_SIZE):
+            doomed += authored.filter(id__in=post_ids[start:start + BATCH_SIZE]).values_list('id', flat=True)
+        for start in range(0, len(doomed), BATCH_SIZE):
+            entries.filter(post_id__in=doomed[start:start + BATCH_SIZE]).delete()
+    else:
+        entries.filter(post__author=author).delete()
+    FeedTombstone.objects.create(user=user, author_id=author.id)
+
+
+def cap_timeline(user_id, keep=None):
+    """Drop a user's timeline rows beyond the newest keep (FEED_TIMELINE_LIMIT)."""
+    keep = keep or settings.FEED_TIMELINE_LIMIT
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    oldest_kept = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[keep - 1:keep])
+    if not oldest_kept:
+        return 0
+    deleted, _ = entries.filter(_below(oldest_kept[0], 'post_id')).delete()
+    return deleted
+
+
+def timeline_posts(user, celebrities=None):
+    """Posts in the user's feed: their timeline rows plus high-follower authors' posts.
+
+    For filters over the whole feed, such as the delta sync; pages are read
+    with feed_keys() instead.
+    """
+    if celebrities is None:
+        celebrities = celebrity_ids(user)
+    timeline = TimelineEntry.objects.filter(user=user).values_list('post_id', flat=True)
+    if sharding.enabled():
+        # a shard can't run the subquery, its timeline table is empty
+        timeline = list(timeline)
+    condition = Q(id__in=timeline)
+    if celebrities:
+        condition |= Q(author_id__in=celebrities)
+    return Post.objects.filter(condition)
+
+
+def _below(key, id_field):
+    """Rows older than a (created_at, id) key."""
+    created_at, pk = key
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, **{f'{id_field}__lt': pk})
+
+
+def _feed_key_queries(user, celebrities, before, limit):
+    entries = TimelineEntry.objects.filter(user=user)
+    if before is not None:
+        entries = entries.filter(_below(before, 'post_id'))
+    yield entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit]
+
+    if not celebrities:
+        return
+    if sharding.enabled():
+        by_shard = defaultdict(list)
+        for author_id in celebrities:
+            by_shard[shard_for_author(author_id)].append(author_id)
+        sources = [Post.objects.using(alias).filter(author_id__in=ids) for alias, ids in by_shard.items()]
+    else:
+        sources = [Post.objects.filter(author_id__in=celebrities)]
+    for posts in sources:
+        if before is not None:
+            posts = posts.filter(_below(before, 'id'))
+        yield posts.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit]
+
+
+def feed_keys(user, celebrities, before=None, limit=20):
+    """(created_at, post id) of the newest feed posts below before, newest first.
+
+    Each source is read off its own index, no more than limit rows: the
+    user's timeline rows by (user, created_at, post), and high-follower
+    authors' posts by (author, created_at, id), once per shard holding some.
+    The streams are merged here.
+    """
+    return merge_newest(_feed_key_queries(user, celebrities, before, limit), limit)
+
+
+async def afeed_keys(user, celebrities, before=None, limit=20):
+    streams = [[key async for key in query] for query in _feed_key_queries(user, celebrities, before, limit)]
+    return merge_newest(streams, limit)
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .counters import add_to_row
+from .models import EngagementBucket
+
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+
+# window name -> (how far back buckets are read, half-life of a bucket's weight)
+WINDOWS = {
+    'hour': (timedelta(hours=1), timedelta(minutes=15)),
+    'day': (timedelta(days=1), timedelta(hours=6)),
+}
+
+
+def bucket_start(moment=None):
+    moment = moment or timezone.now()
+    size = settings.TRENDING_BUCKET_SECONDS
+    return datetime.fromtimestamp(int(moment.timestamp()) // size * size, tz=dt_timezone.utc)
+
+
+def record_engagement(post_id, likes=0, comments=0):
+    deltas = {
+        field: delta
+        for field, delta in (('like_count', likes), ('comment_count', comments))
+        if delta
+    }
+    if deltas:
+        add_to_row(EngagementBucket, {'post_id': post_id, 'bucket_start': bucket_start()}, **deltas)
+
+
+def trending_post_ids(window):
+    """Ids of the fastest-rising posts over the window, cached briefly."""
+    key = f'trending:{window}'
+    post_ids = cache.get(key)
+    if post_ids is None:
+        post_ids = compute_trending(window)
+        cache.set(key, post_ids, settings.TRENDING_CACHE_TIMEOUT)
+    return post_ids
+
+
+def compute_trending(window, now=None):
+    now = now or timezone.now()
+    span, half_life = WINDOWS[window]
+    rows = list(
+        EngagementBucket.objects.filter(bucket_start__gte=now - span).values_list(
+            'post_id', 'bucket_start', 'like_count', 'comment_count'
+        )
+    )
+    if not rows:
+        return []
+
+    post_ids, starts, likes, comments = zip(*rows)
+    ages = np.fromiter(
+        ((now - start).total_seconds() for start in starts), dtype=np.float64, count=len(starts)
+    )
+    # each bucket's engagement decays exponentially with its age
+    weights = np.exp2(-np.maximum(ages, 0.0) / half_life.total_seconds())
+    bucket_scores = (
+        LIKE_WEIGHT * np.array(likes, dtype=np.float64)
+        + COMMENT_WEIGHT * np.array(comments, dtype=np.float64)
+    ) * weights
+
+    posts, index = np.unique(np.array(post_ids, dtype=np.int64), return_inverse=True)
+    scores = np.zeros(len(posts))
+    np.add.at(scores, index, bucket_scores)
+    top = np.argsort(-scores, kind='stable')[:settings.TRENDING_LIMIT]
+    return posts[top[scores[top] > 0]].tolist()
@@ -1,15 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import PostViewSet, CommentViewSet, FeedView, LikePostView, UnlikePostView
+from .views import (
+    PostViewSet, CommentViewSet, AsyncFeedView, FeedView, FeedChangesView, FeedCacheStatsView, LikePostView,
+    UnlikePostView, LikeBatchView, PostLikersView, TagPostsView, TopTagsView,
+)
 
 router = DefaultRouter()
 router.register('posts', PostViewSet)
 router.register('comments', CommentViewSet)
 
 urlpatterns = [
-    path('feed/', FeedView.as_view(), name='feed'),
+    path('feed/', (AsyncFeedView if settings.ASYNC_VIEWS else FeedView).as_view(), name='feed'),
+    path('feed/changes/', FeedChangesView.as_view(), name='feed-changes'),
+    path('feed/cache-stats/', FeedCacheStatsView.as_view(), name='feed-cache-stats'),
     path('posts/<int:pk>/like/', LikePostView.as_view()),
     path('posts/<int:pk>/unlike/', UnlikePostView.as_view()),
+    path('posts/<int:pk>/likes/', PostLikersView.as_view()),
+    path('likes/batch/', LikeBatchView.as_view()),
+    path('tags/top/', TopTagsView.as_view(), name='top-tags'),
+    path('tags/<str:tag>/posts/', TagPostsView.as_view(), name='tag-posts'),
 ]
 
 urlpatterns += router.urls
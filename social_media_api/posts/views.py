@@ -1,40 +1,173 @@
-from rest_framework import viewsets, permissions, filters, status
+from rest_framework import viewsets, permissions, status, generics
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from asgiref.sync import sync_to_async
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer
+from .models import Post, Comment, Like, TaggedPost
+from .serializers import PostSerializer, CommentSerializer, LikeBatchSerializer, LikerSerializer
+from .bulk import create_posts
+from .counters import change_post_counts, post_counts
+from .feed_changes import (
+    changed_posts, decode_cursor, encode_cursor, followed_since, initial_cursor, is_expired, tombstones,
+)
+from .filters import PostSearchFilter
+from .likes import apply_like_operations, like_post, unlike_post
+from .mentions import notify_mentions
+from .pagination import FeedPagination, NewestFirstPagination, TagTimelinePagination
 from .permissions import IsAuthorOrReadOnly
+from .ranking import rank_post_ids
+from .trending import WINDOWS, record_engagement, trending_post_ids
+from .recent_comments import attach_recent_comments
+from .tags import top_tags
+from .threads import build_tree, subtree, without_orphans
+from .timeline import acelebrity_ids, afeed_keys, celebrity_ids, fan_out_posts, feed_keys
+from . import feed_cache
+from .feed_cache import bump_feed_versions
 
+from accounts.restrictions import ahidden_author_ids, hidden_author_ids, visible
+from social_media_api.async_views import AsyncAPIView
+from social_media_api.compiled import compile_serializer
+from social_media_api.fieldsets import is_field_selected, narrow_queryset
+from social_media_api.idempotency import idempotent
+from social_media_api.replicas import primary_reads
+from social_media_api.snowflake import render_id
 from notifications.models import Notification
+from taggit.models import Tag
 from notifications.utils import create_notification
 
 
+INCLUDES = {'recent_comments'}
+
+
+def requested_includes(request):
+    """Optional post embeds asked for with ?include=a,b."""
+    names = request.query_params.get('include', '').split(',')
+    return {name.strip() for name in names} & INCLUDES
+
+
+def prepare_page(request, posts):
+    """Load the requested embeds for one page of posts in bulk."""
+    if 'recent_comments' in requested_includes(request):
+        attach_recent_comments(posts, hidden_author_ids(request.user))
+    return posts
+
+
+def author_of(item):
+    # page items are instances, or .values() rows on the compiled path
+    return item['author'] if isinstance(item, dict) else item.author_id
+
+
+def visible_page(request, page):
+    """The page without content by users the viewer muted or blocked, or who blocked them."""
+    return visible(page, hidden_author_ids(request.user), author_of)
+
+
+def ordering_values(paginator, request, queryset, view):
+    """Columns the cursor is built from, which .values() rows must carry too."""
+    return tuple(name.lstrip('-') for name in paginator.get_ordering(request, queryset, view))
+
+
+def compiled_list(view, queryset):
+    """Paginated list response rendered from .values() rows, None if the fields can't be compiled."""
+    compiled = compile_serializer(view.get_serializer())
+    if compiled is None:
+        return None
+    rows = compiled.values(queryset, 'author', *ordering_values(view.paginator, view.request, queryset, view))
+    page = view.paginate_queryset(rows)
+    return view.get_paginated_response(compiled.to_representation(page))
+
+
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all().order_by('-created_at')
     serializer_class = PostSerializer
+    pagination_class = NewestFirstPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
 
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, PostSearchFilter]
     filterset_fields = ['author']
     search_fields = ['title', 'content', 'author__username']
 
+    def get_queryset(self):
+        posts = super().get_queryset().select_related('author').with_counter_totals()
+        if is_field_selected(self.request, 'liked_by_me') or is_field_selected(self.request, 'commented_by_me'):
+            posts = posts.with_viewer_state(self.request.user)
+        return narrow_queryset(posts, self.get_serializer(), keep=('created_at', 'author'))
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'include': requested_includes(self.request)}
+
+    def list(self, request, *args, **kwargs):
+        response = compiled_list(self, self.filter_queryset(self.get_queryset()))
+        return response or super().list(request, *args, **kwargs)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return page if page is None else prepare_page(self.request, visible_page(self.request, page))
+
+    @action(detail=False)
+    def trending(self, request):
+        window = request.query_params.get('window', 'hour')
+        if window not in WINDOWS:
+            raise ValidationError({'window': f"Expected one of: {', '.join(WINDOWS)}."})
+
+        post_ids = trending_post_ids(window)
+        by_id = self.get_queryset().in_bulk(post_ids)
+        posts = visible_page(request, [by_id[pk] for pk in post_ids if pk in by_id])
+        serializer = self.get_serializer(posts, many=True)
+        return Response({'window': window, 'results': serializer.data})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = self.get_serializer(
+            data=request.data, many=True, allow_empty=False, max_length=settings.POST_BULK_LIMIT,
+        )
+        serializer.is_valid(raise_exception=True)
+        posts = create_posts(request.user, serializer.validated_data)
+        return Response(self.get_serializer(posts, many=True).data, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        fan_out_posts([post])
+        feed_cache.invalidate_author_feeds(post.author)
+        notify_mentions(post.author, [(post.content, post)], "mentioned you in a post")
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        feed_cache.invalidate_author_feeds(post.author)
+
+    def perform_destroy(self, instance):
+        author = instance.author
+        instance.delete()
+        feed_cache.invalidate_author_feeds(author)
 
 
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all().order_by('-created_at')
     serializer_class = CommentSerializer
+    pagination_class = NewestFirstPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
 
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['post', 'author']
     search_fields = ['post__title']
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         comment = serializer.save(author=self.request.user)
         post = comment.post
@@ -45,59 +178,326 @@ class CommentViewSet(viewsets.ModelViewSet):
                 verb= "commented on your post",
                 target= comment
             )
+        notify_mentions(comment.author, [(comment.content, comment)], "mentioned you in a comment")
+        change_post_counts(post.id, comments=1, using=post._state.db)
+        record_engagement(post.id, comments=1)
+        bump_feed_versions([comment.author_id])
+
+    def get_queryset(self):
+        comments = super().get_queryset().select_related('author')
+        # tree mode reads path and parent off the instances
+        return narrow_queryset(comments, self.get_serializer(), keep=('created_at', 'path', 'parent', 'author'))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return page if page is None else visible_page(self.request, page)
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('tree') != '1':
+            response = compiled_list(self, self.filter_queryset(self.get_queryset()))
+            return response or super().list(request, *args, **kwargs)
+
+        comments = self.filter_queryset(self.get_queryset())
+        thread = request.query_params.get('thread')
+        if thread:
+            if not thread.isdigit():
+                raise ValidationError({'thread': 'Expected a comment id.'})
+            root = get_object_or_404(comments, pk=thread)
+            if not visible_page(request, [root]):
+                raise Http404
+            replies = without_orphans(visible_page(request, list(subtree(comments, [root]))), [root])
+            (_, node), = build_tree(replies, self.get_serializer(replies, many=True).data)
+            return Response(node)
+
+        if 'post' not in request.query_params:
+            raise ValidationError({'post': 'Comment trees are listed per post.'})
+        # paginate top-level threads, then load every reply on the page at once
+        page = self.paginate_queryset(comments.filter(parent__isnull=True))
+        replies = without_orphans(visible_page(request, list(subtree(comments, page))), page)
+        threads = {comment.id: node for comment, node in build_tree(replies, self.get_serializer(replies, many=True).data)}
+        return self.get_paginated_response([threads[root.id] for root in page])
+
+    def perform_destroy(self, instance):
+        # replies go with it through the parent foreign key
+        removed = Comment.objects.filter(post_id=instance.post_id, path__startswith=instance.path).count()
+        instance.delete()
+        change_post_counts(instance.post_id, comments=-removed, using=instance._state.db)
+        bump_feed_versions([instance.author_id])
 
 class FeedView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    # the page is cached under the feed version, a lagging replica would pin a stale one
+    @primary_reads()
     def get(self, request):
-        following_users = request.user.following.all()
-        posts = Post.objects.filter(author__in=following_users).order_by('-created_at')
+        celebrities = celebrity_ids(request.user)
+        key = feed_cache.page_key(request.user.id, request.get_full_path(), celebrities)
+        data = feed_cache.get_page(key)
+        if data is not None:
+            return Response(data, headers={'X-Feed-Cache': 'hit'})
+
+        data = self.page_data(request, celebrities)
+        feed_cache.set_page(key, data)
+        return Response(data, headers={'X-Feed-Cache': 'miss'})
+
+    def page_data(self, request, celebrities):
+        ranking = request.query_params.get('ranking', 'latest')
+        if ranking == 'engagement':
+            return self.ranked_page(request, celebrities)
+        elif ranking == 'latest':
+            return self.latest_page(request, celebrities)
+        raise ValidationError({'ranking': "Expected 'latest' or 'engagement'."})
+
+    def get_posts(self, request):
+        posts = Post.objects.select_related('author').with_counter_totals().with_viewer_state(request.user)
+        return narrow_queryset(posts, PostSerializer(context={'request': request}), keep=('created_at', 'author'))
+
+    def load_page(self, request, page_ids, compiled):
+        """The page's posts in page_ids order, as .values() rows when compiled."""
+        posts = self.get_posts(request)
+        if compiled is not None:
+            by_id = {row['id']: row for row in compiled.values(posts.filter(pk__in=page_ids), 'id', 'author')}
+        else:
+            by_id = posts.in_bulk(page_ids)
+        return [by_id[pk] for pk in page_ids if pk in by_id]
+
+    def latest_page(self, request, celebrities):
+        # the page's keys come off the timeline and author indexes, then only its posts are loaded
+        paginator = FeedPagination()
+        before, limit = paginator.start(request)
+        page_ids = paginator.cut(feed_keys(request.user, celebrities, before, limit))
+        compiled = compile_serializer(self.get_serializer(request))
+        page = visible_page(request, self.load_page(request, page_ids, compiled))
+        return paginator.get_paginated_response(self.serialize(request, page, compiled)).data
+
+    def ranked_page(self, request, celebrities):
+        # ranks are computed over ids only, then just the requested page is loaded
+        candidates = [pk for _, pk in feed_keys(request.user, celebrities, limit=settings.FEED_RANKING_CANDIDATES)]
+        paginator = PageNumberPagination()
+        ranked = rank_post_ids(request.user, self.get_posts(request).filter(pk__in=candidates))
+        page_ids = paginator.paginate_queryset(ranked, request, view=self)
+        compiled = compile_serializer(self.get_serializer(request))
+        page = self.load_page(request, page_ids, compiled)
+        return paginator.get_paginated_response(self.serialize(request, page, compiled)).data
+
+    def get_serializer(self, request, *args, **kwargs):
+        context = {'request': request, 'include': requested_includes(request)}
+        return PostSerializer(*args, context=context, **kwargs)
+
+    def serialize(self, request, page, compiled=None):
+        if compiled is not None:
+            return compiled.to_representation(page)
+        return self.get_serializer(request, prepare_page(request, page), many=True).data
+
+
+class AsyncFeedView(AsyncAPIView):
+    """FeedView on the async ORM.
+
+    The default latest-first page is read with awaited queries; ranked and
+    sharded feeds, and pages with embeds, run FeedView's code in a thread.
+    """
+    sync_view = FeedView()
+
+    async def get(self, request):
+        with primary_reads():
+            celebrities = await acelebrity_ids(request.user)
+            key = await feed_cache.apage_key(request.user.id, request.get_full_path(), celebrities)
+            data = await feed_cache.aget_page(key)
+            if data is not None:
+                return Response(data, headers={'X-Feed-Cache': 'hit'})
+
+            compiled = compile_serializer(self.sync_view.get_serializer(request))
+            if compiled is None or request.query_params.get('ranking', 'latest') != 'latest':
+                data = await sync_to_async(self.sync_view.page_data)(request, celebrities)
+            else:
+                data = await self.latest_page(request, celebrities, compiled)
+            await feed_cache.aset_page(key, data)
+            return Response(data, headers={'X-Feed-Cache': 'miss'})
+
+    async def latest_page(self, request, celebrities, compiled):
+        paginator = FeedPagination()
+        before, limit = paginator.start(request)
+        page_ids = paginator.cut(await afeed_keys(request.user, celebrities, before, limit))
+        posts = self.sync_view.get_posts(request).filter(pk__in=page_ids)
+        by_id = {row['id']: row async for row in compiled.values(posts, 'id', 'author')}
+        page = [by_id[pk] for pk in page_ids if pk in by_id]
+        page = visible(page, await ahidden_author_ids(request.user), author_of)
+        return paginator.get_paginated_response(compiled.to_representation(page)).data
 
-        serializer = PostSerializer(posts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class FeedChangesView(APIView):
+    """Posts created or edited in the feed since ?since=<cursor>, plus tombstones.
+
+    Without since, returns just a cursor for the feed as it is now. A tombstone
+    with a null post stands for all of that author's posts (an unfollow);
+    clients apply tombstones before the changed posts.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    # the cursor moves to the feed version, the changes up to it must not come from a lagging replica
+    @primary_reads()
+    def get(self, request):
+        celebrities = celebrity_ids(request.user)
+        version = feed_cache.feed_version(request.user.id, celebrities)
+        since = request.query_params.get('since')
+        if not since:
+            return Response(self.changes([], [], initial_cursor(version), has_more=False))
+
+        try:
+            cursor = decode_cursor(since)
+        except ValueError:
+            raise ValidationError({'since': 'Invalid cursor.'})
+        if is_expired(cursor):
+            return Response(
+                {"detail": "Cursor expired, reload the feed."}, status=status.HTTP_410_GONE
+            )
+        now = timezone.now()
+        if cursor.version == version:
+            return Response(self.changes([], [], cursor._replace(issued_at=now), has_more=False))
+        if followed_since(request.user, cursor):
+            return Response(
+                {"detail": "New follows added older posts, reload the feed."}, status=status.HTTP_410_GONE
+            )
+
+        limit = settings.FEED_CHANGES_LIMIT
+        posts = list(
+            changed_posts(request.user, celebrities, cursor)
+            .select_related('author')
+            .with_counter_totals()
+            .with_viewer_state(request.user)[:limit + 1]
+        )
+        buried = list(tombstones(request.user, cursor)[:limit + 1])
+        has_more = len(posts) > limit or len(buried) > limit
+        posts, buried = posts[:limit], buried[:limit]
+
+        cursor = cursor._replace(
+            # a partial batch leaves the version stale, so the next poll keeps reading
+            version='' if has_more else version,
+            issued_at=now,
+        )
+        if posts:
+            cursor = cursor._replace(updated_at=posts[-1].updated_at, post_id=posts[-1].id)
+        if buried:
+            cursor = cursor._replace(tombstone_id=buried[-1].id)
+        context = {'request': request, 'include': set()}
+        # the cursor above still moves past hidden authors' posts
+        posts = visible_page(request, posts)
+        return Response(self.changes(
+            PostSerializer(posts, many=True, context=context).data, buried, cursor, has_more,
+        ))
+
+    def changes(self, posts, buried, cursor, has_more):
+        return {
+            'posts': posts,
+            'tombstones': [{'post': render_id(t.post_id), 'author': t.author_id} for t in buried],
+            'cursor': encode_cursor(cursor),
+            'has_more': has_more,
+        }
+
+
+class TagPostsView(APIView):
+    """Posts with a hashtag, paged off the tag table's (tag, created_at) index."""
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, tag):
+        tag = get_object_or_404(Tag, slug=tag.lower())
+        paginator = TagTimelinePagination()
+        page = paginator.paginate_queryset(
+            TaggedPost.objects.filter(tag=tag).only('id', 'created_at', 'content_object_id'), request, view=self
+        )
+        post_ids = [tagged.content_object_id for tagged in page]
+        by_id = (
+            Post.objects.select_related('author')
+            .with_counter_totals()
+            .with_viewer_state(request.user)
+            .in_bulk(post_ids)
+        )
+        posts = prepare_page(request, visible_page(request, [by_id[pk] for pk in post_ids if pk in by_id]))
+        context = {'request': request, 'include': requested_includes(request)}
+        return paginator.get_paginated_response(PostSerializer(posts, many=True, context=context).data)
+
+
+class TopTagsView(APIView):
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request):
+        return Response({'results': top_tags()})
+
+
+class FeedCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(feed_cache.stats())
 
 
 class LikePostView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, pk):
-        user = request.user
-        post = get_object_or_404(Post, id=pk)
+        post = get_object_or_404(Post.objects.select_related('author'), id=pk)
 
-        if Like.objects.filter(user=user, post=post).exists():
+        if not like_post(request.user, post):
             return Response({"detail": "You already liked this post."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        Like.objects.create(user=user, post=post)
-
-        if post.author != user:
-            create_notification(
-                recipient=post.author,
-                actor=user,
-                verb="liked your post",
-                target=post
-            )
 
         return Response(
             {"detail": "Post liked successfully."},
             status=status.HTTP_201_CREATED
         )
 
+    # PUT and DELETE are idempotent and report the resulting state
+
+    def put(self, request, pk):
+        post = get_object_or_404(Post.objects.select_related('author'), id=pk)
+        like_post(request.user, post)
+        return self.like_state(pk, liked=True)
+
+    def delete(self, request, pk):
+        unlike_post(request.user, pk)
+        return self.like_state(pk, liked=False)
+
+    def like_state(self, pk, liked):
+        try:
+            like_count, _ = post_counts(pk)
+        except Post.DoesNotExist:
+            raise Http404
+        return Response({"liked": liked, "like_count": like_count})
+
 
 class UnlikePostView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, pk):
-        user = request.user
         post = get_object_or_404(Post, id=pk)
 
-        like = Like.objects.filter(user=user, post=post).first()
-
-        if not like:
+        if not unlike_post(request.user, post.id):
             return Response({"detail": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        like.delete()
+
         return Response({'detail': 'Post unliked successfully!'}, status=status.HTTP_200_OK)
-          
+
+
+class PostLikersView(generics.ListAPIView):
+    serializer_class = LikerSerializer
+    pagination_class = NewestFirstPagination
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get_queryset(self):
+        return (
+            Like.objects.filter(post_id=self.kwargs['pk'])
+            .select_related('user')
+            .only('id', 'post_id', 'created_at', 'user__id', 'user__username', 'user__profile_picture')
+        )
+
+
+class LikeBatchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = LikeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_like_operations(request.user, serializer.validated_data['operations'])
+        return Response({"results": results})
 
 
 ["generics.get_object_or_404(Post, pk=pk)", "Like.objects.get_or_create(user=request.user, post=post)", "Notification.objects.create"]
@@ -0,0 +1,75 @@
+"""Async read views for ASGI, served instead of the sync ones when ASYNC_VIEWS is on.
+
+DRF's APIView dispatches synchronously, so under ASGI each request to one
+holds a thread for its whole duration. AsyncAPIView keeps what the async
+views need from it (token authentication, IsAuthenticated, DRF error bodies
+and JSON rendering) and awaits the async ORM instead. Handlers return a
+DRF Response, which is rendered here as plain JSON.
+"""
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+
+async def authenticate_token(request):
+    """The user of an 'Authorization: Token <key>' header, as TokenAuthentication does it.
+
+    Returns None when there is no token header at all.
+    """
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if not auth or auth[0].lower() != 'token':
+        return None
+    if len(auth) == 1:
+        raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
+    if len(auth) > 2:
+        raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+    try:
+        token = await Token.objects.select_related('user').aget(key=auth[1])
+    except Token.DoesNotExist:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    return token.user
+
+
+class AsyncAPIView(View):
+    """Authenticated read-only endpoint with async handlers."""
+    http_method_names = ['get', 'head', 'options']
+    renderer = JSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        # shared helpers expect a DRF request (query_params, user)
+        request = Request(request)
+        try:
+            user = await authenticate_token(request)
+            if user is None:
+                raise exceptions.NotAuthenticated()
+            request.user = user
+            response = await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc, request)
+        return self.render(response)
+
+    def handle_exception(self, exc, request):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.auth_header = 'Token'
+        response = exception_handler(exc, {'view': self, 'request': request})
+        if response is None:
+            raise exc
+        return response
+
+    def render(self, response):
+        if not hasattr(response, 'data'):
+            # plain Django responses, e.g. 405 or OPTIONS
+            return response
+        rendered = HttpResponse(
+            self.renderer.render(response.data), status=response.status_code, content_type='application/json'
+        )
+        for header, value in response.items():
+            if header != 'Content-Type':
+                rendered[header] = value
+        return rendered
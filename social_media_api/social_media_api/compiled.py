@@ -0,0 +1,139 @@
+"""Read-only serializer fast path over .values() rows.
+
+compile_serializer() turns a serializer's field declarations into one
+generated function that builds output dicts straight from .values() rows,
+skipping per-field get_attribute() walks over model instances. The output
+matches what the serializer itself renders, key order included.
+
+Method fields are only compiled when the serializer maps them to a queryset
+value in Meta.value_sources, e.g. {'like_count': 'like_total'}. Anything
+else it can't reproduce exactly (nested serializers, file fields, custom
+relations) makes compile_serializer() return None so callers fall back to
+the regular serializer.
+"""
+import copy
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import ISO_8601
+from rest_framework import fields as drf_fields
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+from . import sharding
+
+# fields whose to_representation() is a no-op for the values a query returns
+PASSTHROUGH = (drf_fields.ReadOnlyField, drf_fields.CharField, drf_fields.IntegerField)
+UNSUPPORTED = (
+    BaseSerializer, ManyRelatedField, drf_fields.FileField, drf_fields.HiddenField,
+    drf_fields.ListField, drf_fields.DictField, drf_fields.JSONField,
+)
+
+_compiled = {}
+
+
+class CompiledSerializer:
+    def __init__(self, value_names, convert):
+        self.value_names = value_names
+        self.convert = convert
+
+    def values(self, queryset, *extra):
+        """The .values() projection the compiled function reads from."""
+        return queryset.values(*dict.fromkeys(self.value_names + extra))
+
+    def to_representation(self, rows):
+        return self.convert(rows)
+
+
+def compile_serializer(serializer):
+    """CompiledSerializer for the serializer's current fields, or None."""
+    if not settings.COMPILED_SERIALIZERS:
+        return None
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is not None and sharding.enabled() and sharding.is_sharded(model):
+        # .values() joins the author, and a shard's user table is empty
+        return None
+    fields = serializer.fields
+    key = (type(serializer), tuple(fields))
+    if key not in _compiled:
+        _compiled[key] = _compile(serializer, fields)
+    return _compiled[key]
+
+
+def _compile(serializer, fields):
+    value_sources = getattr(getattr(serializer, 'Meta', None), 'value_sources', {})
+    names, entries = [], []
+    namespace = {'default_timezone': drf_fields.DateTimeField().default_timezone}
+
+    for i, (name, field) in enumerate(fields.items()):
+        if field.write_only:
+            continue
+        if isinstance(field, drf_fields.SerializerMethodField):
+            if name not in value_sources:
+                return None
+            # method fields render whatever they return, None included
+            names.append(value_sources[name])
+            entries.append(f'{name!r}: row[{value_sources[name]!r}]')
+            continue
+        if field.source == '*' or isinstance(field, UNSUPPORTED) or not _is_plain(field):
+            return None
+
+        value = field.source.replace('.', '__')
+        names.append(value)
+        if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is not None:
+            # values() already gives the pk for a foreign key, pk_field renders it
+            namespace[f'convert_{i}'] = copy.deepcopy(field.pk_field).to_representation
+            entries.append(f'{name!r}: None if row[{value!r}] is None else convert_{i}(row[{value!r}])')
+        elif isinstance(field, PASSTHROUGH) or isinstance(field, PrimaryKeyRelatedField):
+            entries.append(f'{name!r}: row[{value!r}]')
+        elif _is_iso_datetime(field):
+            namespace[f'convert_{i}'] = _iso_datetime(copy.deepcopy(field))
+            entries.append(f'{name!r}: None if row[{value!r}] is None else convert_{i}(row[{value!r}], tz)')
+        else:
+            # an unbound copy, so the cache doesn't hold on to the request
+            namespace[f'convert_{i}'] = copy.deepcopy(field).to_representation
+            entries.append(f'{name!r}: None if row[{value!r}] is None else convert_{i}(row[{value!r}])')
+
+    source = (
+        'def convert(rows):\n'
+        '    tz = default_timezone()\n'
+        '    return [{%s} for row in rows]\n'
+    ) % ', '.join(entries)
+    exec(source, namespace)
+    return CompiledSerializer(tuple(names), namespace['convert'])
+
+
+def _is_plain(field):
+    return isinstance(field, PrimaryKeyRelatedField) or not isinstance(field, RelatedField)
+
+
+def _is_iso_datetime(field):
+    if type(field) is not drf_fields.DateTimeField or hasattr(field, 'timezone'):
+        return False
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    return output_format is not None and output_format.lower() == ISO_8601
+
+
+def _iso_datetime(field):
+    """DateTimeField.to_representation() taking the current timezone, looked up once per page."""
+    to_representation = field.to_representation
+
+    def convert(value, tz):
+        if tz is None or isinstance(value, str) or value.utcoffset() is None:
+            return to_representation(value)
+        try:
+            value = value.astimezone(tz).isoformat()
+        except OverflowError:
+            return to_representation(value)
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return convert
+
+
+@receiver(setting_changed)
+def _clear_compiled(*, setting, **kwargs):
+    # compiled functions bake in REST_FRAMEWORK formats and how ids are rendered
+    if setting in ('REST_FRAMEWORK', 'SNOWFLAKE_IDS'):
+        _compiled.clear()
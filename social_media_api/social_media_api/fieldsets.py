@@ -0,0 +1,117 @@
+"""Sparse fieldsets: ?fields=a,b keeps only those fields, ?omit=a,b drops them.
+
+SparseFieldsetMixin trims what a serializer renders and narrow_queryset()
+trims what the query loads to match, so unrequested columns, joins and
+prefetches are skipped as well.
+"""
+from django.contrib.contenttypes.fields import GenericForeignKey
+from rest_framework import permissions
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import ListSerializer
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def is_sparse(request):
+    return (
+        request is not None
+        and request.method in permissions.SAFE_METHODS
+        and ('fields' in request.query_params or 'omit' in request.query_params)
+    )
+
+
+def is_field_selected(request, name):
+    """Whether a top-level field will be rendered for this request."""
+    if not is_sparse(request):
+        return True
+    fields, omit = _names(request, 'fields'), _names(request, 'omit') or set()
+    return (fields is None or name in fields) and name not in omit
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin applying ?fields= / ?omit= to read requests.
+
+    Only the top-level serializer is trimmed; nested serializers render in full.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        parent = self.parent.parent if isinstance(self.parent, ListSerializer) else self.parent
+        if parent is not None or not is_sparse(request):
+            return fields
+        return {name: field for name, field in fields.items() if is_field_selected(request, name)}
+
+
+def narrow_queryset(queryset, serializer, keep=()):
+    """Defer columns, joins and prefetches the serializer's selected fields don't use.
+
+    keep names model fields that must stay loaded anyway, such as the
+    pagination ordering.
+    """
+    if not is_sparse(serializer.context.get('request')):
+        return queryset
+
+    model = queryset.model
+    child = getattr(serializer, 'child', serializer)
+    needed = set(keep)
+    joins = {}  # relation name -> related field names needed, None for all
+    prefetch = []
+
+    for name, field in child.fields.items():
+        if field.source == '*':
+            # method fields compute from the object, keep anything of the same name
+            needed.add(name)
+            continue
+        attrs = field.source.split('.')
+        needed.add(attrs[0])
+        model_field = _model_field(model, attrs[0])
+        if model_field is None:
+            continue
+        if isinstance(model_field, GenericForeignKey):
+            needed.update((model_field.ct_field, model_field.fk_field))
+            prefetch.append(attrs[0])
+        elif model_field.many_to_many:
+            prefetch.append(attrs[0])
+        elif model_field.many_to_one or model_field.one_to_one:
+            if len(attrs) > 1:
+                if joins.get(attrs[0], set()) is not None:
+                    joins.setdefault(attrs[0], set()).add(attrs[1])
+            elif not isinstance(field, PrimaryKeyRelatedField):
+                # rendered from the related object itself, e.g. StringRelatedField
+                joins[attrs[0]] = None
+
+    deferred = [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in needed and field.attname not in needed
+    ]
+    for relation, related_names in joins.items():
+        if related_names is None:
+            continue
+        related_model = model._meta.get_field(relation).related_model
+        deferred.extend(
+            f'{relation}__{field.name}' for field in related_model._meta.concrete_fields
+            if not field.primary_key and field.name not in related_names
+        )
+
+    queryset = queryset.select_related(None)
+    if joins:
+        queryset = queryset.select_related(*joins)
+    # the view may have prefetched these already, with its own querysets
+    seen = {getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups}
+    prefetch = [name for name in prefetch if name not in seen]
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.defer(*deferred)
+
+
+def _model_field(model, name):
+    for field in model._meta.get_fields():
+        if field.name == name:
+            return field
+    return None
@@ -0,0 +1,96 @@
+"""Idempotency-Key support for write endpoints that clients retry.
+
+The first response to a key is cached for IDEMPOTENCY_KEY_TTL seconds and a
+retry with the same key gets it back from one cache lookup, without the view
+running again. While the first request is still running, duplicates wait for
+its response (up to IDEMPOTENCY_WAIT_SECONDS, then 409) instead of racing it.
+Reusing a key with a different body is a 422.
+
+Keys are scoped to the user and the path. Exceptions and 5xx responses are
+not stored, so a retry after one of those runs the view again. Like the feed
+cache, this needs a cache shared by every worker (REDIS_URL) in production.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# an abandoned claim (crashed worker) frees the key again after this long
+LOCK_TIMEOUT = 60
+POLL_INTERVAL = 0.05
+
+
+def cache_keys(user_id, path, key):
+    """(stored response, in-flight claim) cache keys for one Idempotency-Key."""
+    digest = hashlib.sha256(f'{user_id}:{path}:{key}'.encode()).hexdigest()
+    return f'idempotency:response:{digest}', f'idempotency:lock:{digest}'
+
+
+def fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def replay(stored, request_fingerprint):
+    if stored['fingerprint'] != request_fingerprint:
+        return Response(
+            {"detail": f"This {HEADER} was already used with a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(stored['data'], status=stored['status'], headers={**stored['headers'], 'Idempotent-Replayed': 'true'})
+
+
+def idempotent(handler):
+    """Honour an Idempotency-Key header on a DRF view handler such as post() or create()."""
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({HEADER: f"Must be at most {MAX_KEY_LENGTH} characters."})
+
+        response_key, lock_key = cache_keys(request.user.id, request.path, key)
+        request_fingerprint = fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            stored = cache.get(response_key)
+            if stored is not None:
+                return replay(stored, request_fingerprint)
+            if cache.add(lock_key, True, LOCK_TIMEOUT):
+                break
+            # another request with this key is running, wait for its response
+            if time.monotonic() >= deadline:
+                return Response(
+                    {"detail": f"A request with this {HEADER} is still in progress."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(response_key, {
+                    'fingerprint': request_fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                    'headers': {name: value for name, value in response.items() if name != 'Content-Type'},
+                }, settings.IDEMPOTENCY_KEY_TTL)
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    return wrapper
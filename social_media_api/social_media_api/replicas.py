@@ -0,0 +1,161 @@
+"""Read replicas for GET traffic.
+
+Every DATABASE_URL_REPLICA_<n> variable adds a database 'replica_<n>', a
+read-only copy of 'default'. ReplicaMiddleware turns on replica reads for
+safe-method requests and ReplicaRouter spreads those reads over the
+replicas; everything else goes to the primary as before.
+
+Replicas lag, so a client that just wrote is pinned to the primary for
+REPLICA_PIN_SECONDS: a cache marker keyed by its credentials, set after
+any unsafe request, keeps its reads off the replicas until it expires.
+Credentials an unsafe request hands out (the token from register or login,
+a new session cookie) are pinned too, a replica may not have them yet.
+The middleware drops out when no replica is configured, and runs natively
+under ASGI as well as WSGI.
+
+Reads whose result is cached under the current feed version (feed pages,
+feed change cursors, hidden authors) go to the primary inside
+primary_reads(): a page read from a lagging replica would otherwise be kept
+under the new version and never refreshed.
+
+Sharded models (see social_media_api.sharding) are left to ShardRouter,
+the shards have no replicas. Don't run migrate against a replica.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+from . import sharding
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def enabled():
+    return bool(settings.READ_REPLICAS)
+
+
+@contextmanager
+def replica_reads(on=True):
+    """Route reads in this block to the replicas."""
+    token = _replica_reads.set(on)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def primary_reads():
+    """Route reads in this block, or a decorated sync function, to the primary."""
+    return replica_reads(on=False)
+
+
+def _pin_key(credentials):
+    return 'replica-pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def _credentials(request):
+    return request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+
+
+def _issued_credentials(response):
+    """Credentials the response gives the client: a token in its body, a session cookie."""
+    issued = []
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and isinstance(data.get('token'), str):
+        issued.append(f"Token {data['token']}")
+    cookie = response.cookies.get(settings.SESSION_COOKIE_NAME)
+    if cookie is not None and cookie.value:
+        issued.append(cookie.value)
+    return issued
+
+
+def _pin_keys(request, response):
+    credentials = [_credentials(request), *_issued_credentials(response)]
+    return dict.fromkeys({_pin_key(c) for c in credentials if c}, True)
+
+
+def is_pinned(request):
+    credentials = _credentials(request)
+    return credentials is not None and cache.get(_pin_key(credentials)) is not None
+
+
+async def ais_pinned(request):
+    credentials = _credentials(request)
+    return credentials is not None and await cache.aget(_pin_key(credentials)) is not None
+
+
+def pin_to_primary(request, response):
+    keys = _pin_keys(request, response)
+    if keys:
+        cache.set_many(keys, settings.REPLICA_PIN_SECONDS)
+
+
+async def apin_to_primary(request, response):
+    keys = _pin_keys(request, response)
+    if keys:
+        await cache.aset_many(keys, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method in SAFE_METHODS:
+            if is_pinned(request):
+                return self.get_response(request)
+            with replica_reads():
+                return self.get_response(request)
+        response = self.get_response(request)
+        pin_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if request.method in SAFE_METHODS:
+            if await ais_pinned(request):
+                return await self.get_response(request)
+            with replica_reads():
+                return await self.get_response(request)
+        response = await self.get_response(request)
+        await apin_to_primary(request, response)
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not enabled():
+            return None
+        if sharding.enabled() and sharding.is_sharded(model):
+            return None
+        return random.choice(settings.READ_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.READ_REPLICAS:
+            # an object read from a replica is saved back to the primary
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *settings.READ_REPLICAS}
+        if enabled() and obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
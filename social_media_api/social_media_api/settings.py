@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
+    'taggit',
     'accounts',
     'posts',
     'notification',
@@ -69,6 +70,78 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+# Feed: posts are fanned out into each follower's timeline on write, except for
+# authors above this follower count, whose posts are pulled at read time instead.
+FEED_FANOUT_FOLLOWER_LIMIT = config('FEED_FANOUT_FOLLOWER_LIMIT', default=10000, cast=int)
+# How many of an author's recent posts are copied into a timeline on follow.
+FEED_BACKFILL_LIMIT = 200
+# Timeline rows kept per user; run trim_timelines periodically to drop older ones.
+FEED_TIMELINE_LIMIT = 1000
+# Newest posts considered when the feed is ranked with ?ranking=engagement.
+FEED_RANKING_CANDIDATES = 1000
+# Seconds a rendered feed page is cached; pages are also invalidated on writes.
+FEED_CACHE_TIMEOUT = 300
+# Most changed posts (and tombstones) returned by one /api/feed/changes/ call.
+FEED_CHANGES_LIMIT = 100
+# Days deletion tombstones are kept; older delta sync cursors get 410 Gone.
+FEED_TOMBSTONE_RETENTION_DAYS = 30
+
+# Spread like/comment counter updates over this many rows per post. 1 writes
+# straight to the Post row; raise it if hot posts show lock contention.
+POST_COUNTER_SHARDS = config('POST_COUNTER_SHARDS', default=1, cast=int)
+
+# Trending posts: engagement is counted in slots of this many seconds, and the
+# leaderboard computed from them is cached for TRENDING_CACHE_TIMEOUT seconds.
+TRENDING_BUCKET_SECONDS = 300
+TRENDING_CACHE_TIMEOUT = 60
+TRENDING_LIMIT = 20
+
+# Comments embedded per post by ?include=recent_comments.
+RECENT_COMMENTS_LIMIT = 3
+# Most full-text matches ranked for one ?search= query on /api/posts/.
+SEARCH_MAX_RESULTS = 500
+# Seconds a viewer's muted/blocked id array stays cached; changes also invalidate it.
+HIDDEN_AUTHORS_CACHE_TIMEOUT = 3600
+# Top hashtags on /api/tags/top/: counted over the last TAG_TOP_WINDOW_HOURS,
+# cached for TAG_TOP_CACHE_TIMEOUT seconds.
+TAG_TOP_WINDOW_HOURS = 24
+TAG_TOP_CACHE_TIMEOUT = 300
+TAG_TOP_LIMIT = 20
+# Most posts accepted by one POST /api/posts/bulk/ request.
+POST_BULK_LIMIT = 500
+# Responses to Idempotency-Key requests are replayed for this many seconds;
+# a duplicate of a request still running waits up to IDEMPOTENCY_WAIT_SECONDS.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT_SECONDS = 10
+# Time-ordered 64-bit primary keys for posts, comments, likes and notifications,
+# see social_media_api/snowflake.py. Each process leases its own node id from
+# the cache (needs REDIS_URL); SNOWFLAKE_NODE_ID fixes it for a single process.
+SNOWFLAKE_IDS = config('SNOWFLAKE_IDS', default=False, cast=bool)
+SNOWFLAKE_NODE_ID = config('SNOWFLAKE_NODE_ID', default=None, cast=lambda value: int(value) if value else None)
+# Render plain list pages from .values() rows, see social_media_api/compiled.py.
+COMPILED_SERIALIZERS = True
+# Serve the feed, notification and follower list endpoints from the async
+# views in social_media_api/async_views.py; only worth it under ASGI.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# Local memory by default (tests, single process). Set REDIS_URL in production
+# so every worker shares the same cached feeds and feed versions.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -77,10 +150,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'social_media_api.replicas.ReplicaMiddleware',
 ]
 MIDDLEWARE.insert(
     1,
-    'whitenoise.middleware.WhiteNoiseMiddleware'
+    # WhiteNoise, async capable so ASGI requests don't hop through a thread
+    'social_media_api.static.StaticFilesMiddleware'
 )
 
 ROOT_URLCONF = 'social_media_api.urls'
@@ -112,6 +187,46 @@ DATABASES = {
     'default': dj_database_url.config(default=config('DATABASE_URL'))
 }
 
+import os
+from django.core.exceptions import ImproperlyConfigured
+
+
+def databases_from_env(prefix, alias_prefix):
+    """Add a database for each <prefix><n> variable, returning the aliases in order."""
+    aliases = []
+    for name in sorted((n for n in os.environ if n.startswith(prefix)), key=lambda n: int(n[len(prefix):])):
+        alias = f'{alias_prefix}{name[len(prefix):]}'
+        DATABASES[alias] = dj_database_url.parse(os.environ[name])
+        aliases.append(alias)
+    return aliases
+
+
+if SNOWFLAKE_IDS and SNOWFLAKE_NODE_ID is None and not REDIS_URL:
+    # a process-local cache can't keep the node id leases of several workers apart
+    raise ImproperlyConfigured(
+        "SNOWFLAKE_IDS needs REDIS_URL so each process can lease its own node id, "
+        "or SNOWFLAKE_NODE_ID when only one process writes."
+    )
+
+
+# Posts, comments and likes are spread over the databases named by
+# DATABASE_URL_SHARD_0, DATABASE_URL_SHARD_1, ... when any is set,
+# see social_media_api/sharding.py. Changing the count moves authors.
+POST_SHARDS = databases_from_env('DATABASE_URL_SHARD_', 'shard_')
+if POST_SHARDS and not SNOWFLAKE_IDS:
+    raise ImproperlyConfigured("Sharding posts needs SNOWFLAKE_IDS, ids must be unique across shards.")
+
+# Safe-method requests read from DATABASE_URL_REPLICA_0, _1, ... when any is
+# set, see social_media_api/replicas.py. A client that just wrote reads from
+# the primary for REPLICA_PIN_SECONDS.
+READ_REPLICAS = databases_from_env('DATABASE_URL_REPLICA_', 'replica_')
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+DATABASE_ROUTERS = [
+    'social_media_api.replicas.ReplicaRouter',
+    'social_media_api.sharding.ShardRouter',
+]
+
 
 # DATABASES = {
 #     'default': {
@@ -0,0 +1,300 @@
+"""Horizontal sharding of posts, comments and likes by author id.
+
+Every DATABASE_URL_SHARD_<n> variable adds a database 'shard_<n>'. A post,
+its comments, its likes and its counter rows live on the shard its author's
+id hashes to; users, timelines, notifications and tags stay in 'default'.
+With no shard configured nothing changes.
+
+Post ids must be unique across shards, so sharding needs SNOWFLAKE_IDS. Each
+database gets the full schema (migrate --database=shard_<n>), and foreign
+keys that cross databases are declared with db_constraint=False.
+
+Writes are placed by ShardRouter from the instance being saved or the post or
+author it is attached to. Reads, point lookups, updates, deletes and counts
+on a sharded model with no database chosen fan out to every shard
+(ShardedQuerySet); ordered reads are merged on their ORDER BY columns, and a
+slice [low:high] reads up to high rows per shard and is cut after the merge.
+Ordering on a related field or an expression can't be merged and raises
+NotSupportedError. Queries touching users (joins, select_related) can't be
+joined on a shard, whose user table is empty.
+"""
+import hashlib
+import heapq
+from collections import defaultdict
+from functools import total_ordering
+from itertools import chain, groupby, islice
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError
+from django.db.models import F, OrderBy
+from django.db.models.query import FlatValuesListIterable, ModelIterable, ValuesListIterable
+
+from .snowflake import SnowflakeQuerySet
+
+SHARDED_MODELS = {'posts.post', 'posts.comment', 'posts.like', 'posts.postcountershard'}
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def shard_for_author(author_id):
+    shards = settings.POST_SHARDS
+    # md5 rather than hash(): the placement must not change between processes
+    digest = hashlib.md5(str(author_id).encode()).digest()
+    return shards[int.from_bytes(digest[:8], 'big') % len(shards)]
+
+
+def shard_for_instance(instance):
+    """The shard a sharded row lives on, or None if it can't be told."""
+    if instance._state.db in settings.POST_SHARDS:
+        return instance._state.db
+    if instance._meta.label_lower == 'posts.post' and instance.author_id is not None:
+        return shard_for_author(instance.author_id)
+    post_field = next((f for f in instance._meta.concrete_fields if f.name == 'post'), None)
+    if post_field is not None and post_field.is_cached(instance):
+        return shard_for_instance(post_field.get_cached_value(instance))
+    return None
+
+
+def shard_for_hints(model, hints):
+    instance = hints.get('instance')
+    if instance is None:
+        return None
+    if instance._meta.label_lower == settings.AUTH_USER_MODEL.lower():
+        # user.posts lives on the user's shard, their likes and comments don't
+        return shard_for_author(instance.pk) if model._meta.label_lower == 'posts.post' else None
+    if is_sharded(type(instance)):
+        return shard_for_instance(instance)
+    return None
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def _route(self, model, hints):
+        if not enabled():
+            return None
+        if not is_sharded(model):
+            # without this, Django would follow a sharded instance hint onto its shard
+            return DEFAULT_DB_ALIAS
+        return shard_for_hints(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled() and (is_sharded(type(obj1)) or is_sharded(type(obj2))):
+            return True
+        return None
+
+    # allow_migrate is left undecided: every database gets every table
+
+
+def _placed(obj):
+    alias = shard_for_instance(obj)
+    if alias is None:
+        raise ValueError(f"Can't tell which shard {obj!r} belongs on, set its post or author.")
+    return alias
+
+
+def _paths(tree, prefix=''):
+    for name, subtree in tree.items():
+        if subtree:
+            yield from _paths(subtree, f'{prefix}{name}__')
+        else:
+            yield prefix + name
+
+
+@total_ordering
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _row_getter(queryset, name):
+    """Function reading the column name off one of queryset's rows."""
+    names = {name}
+    try:
+        field = queryset.model._meta.get_field(name)
+        names |= {field.name, getattr(field, 'attname', field.name)}
+    except FieldDoesNotExist:
+        field = None
+    iterable = queryset._iterable_class
+
+    if iterable is ModelIterable:
+        attname = getattr(field, 'attname', name)
+        return lambda row: getattr(row, attname)
+    if iterable is FlatValuesListIterable:
+        if names & set(queryset._fields):
+            return lambda row: row
+    elif issubclass(iterable, ValuesListIterable):
+        positions = [i for i, field_name in enumerate(queryset._fields) if field_name in names]
+        if positions:
+            return lambda row: row[positions[0]]
+    else:
+        def get(row):
+            for key in names & row.keys():
+                return row[key]
+            raise NotSupportedError(f"Can't merge shards on {name!r}, it isn't among the selected values.")
+        return get
+    raise NotSupportedError(f"Can't merge shards on {name!r}, it isn't among the selected values.")
+
+
+def _merge_key(queryset):
+    """Sort key putting queryset's rows from several shards in its ORDER BY order."""
+    columns = []
+    for ordering in queryset.query.order_by or queryset.model._meta.ordering:
+        if isinstance(ordering, OrderBy) and isinstance(ordering.expression, F):
+            name, descending = ordering.expression.name, ordering.descending
+        elif isinstance(ordering, str) and ordering != '?':
+            name, descending = ordering.lstrip('-'), ordering.startswith('-')
+        else:
+            raise NotSupportedError(f"Can't merge shards on the ordering {ordering!r}, use .using().")
+        if '__' in name:
+            raise NotSupportedError(f"Can't merge shards on the related ordering {name!r}, use .using().")
+        if name == 'pk':
+            name = queryset.model._meta.pk.name
+        columns.append((_row_getter(queryset, name), descending))
+    return lambda row: tuple(_Descending(get(row)) if descending else get(row) for get, descending in columns)
+
+
+class ShardedQuerySet(SnowflakeQuerySet):
+    """Fans queries out over the shards when no database can be picked."""
+
+    def _shards(self):
+        """One clone of this queryset per shard, or None if it goes to one database."""
+        if not enabled() or self._db is not None or shard_for_hints(self.model, self._hints):
+            return None
+        return [self._on_shard(alias) for alias in settings.POST_SHARDS]
+
+    def _on_shard(self, alias):
+        queryset = self.using(alias)
+        select_related = queryset.query.select_related
+        if select_related:
+            # a shard's user table is empty, related rows are loaded through the router instead
+            lookups = [] if select_related is True else _paths(select_related)
+            queryset = queryset.select_related(None).prefetch_related(*lookups)
+        return queryset
+
+    def get(self, *args, **kwargs):
+        shards = self._shards()
+        if shards is None:
+            return super().get(*args, **kwargs)
+        for queryset in shards:
+            try:
+                return queryset.get(*args, **kwargs)
+            except self.model.DoesNotExist:
+                pass
+        raise self.model.DoesNotExist(f"{self.model._meta.object_name} matching query does not exist.")
+
+    def in_bulk(self, id_list=None, **kwargs):
+        shards = self._shards()
+        if shards is None:
+            return super().in_bulk(id_list, **kwargs)
+        found = {}
+        for queryset in shards:
+            found.update(queryset.in_bulk(id_list, **kwargs))
+        return found
+
+    def count(self):
+        shards = self._shards()
+        if shards is None:
+            return super().count()
+        return sum(queryset.count() for queryset in shards)
+
+    def exists(self):
+        shards = self._shards()
+        if shards is None:
+            return super().exists()
+        return any(queryset.exists() for queryset in shards)
+
+    def update(self, **kwargs):
+        shards = self._shards()
+        if shards is None:
+            return super().update(**kwargs)
+        return sum(queryset.update(**kwargs) for queryset in shards)
+
+    def delete(self):
+        shards = self._shards()
+        if shards is None:
+            return super().delete()
+        total, per_model = 0, defaultdict(int)
+        for queryset in shards:
+            deleted, counts = queryset.delete()
+            total += deleted
+            for label, count in counts.items():
+                per_model[label] += count
+        return total, dict(per_model)
+
+    def create(self, **kwargs):
+        if not enabled() or self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=_placed(obj))
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if not enabled() or self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+        by_shard = defaultdict(list)
+        for obj in objs:
+            by_shard[_placed(obj)].append(obj)
+        for alias, shard_objs in by_shard.items():
+            self.using(alias).bulk_create(shard_objs, *args, **kwargs)
+        return objs
+
+    def _merged(self, streams):
+        if not self.ordered:
+            return chain.from_iterable(streams)
+        return heapq.merge(*streams, key=_merge_key(self))
+
+    def _fetch_all(self):
+        shards = self._result_cache is None and self._shards()
+        if not shards:
+            return super()._fetch_all()
+        query = self.query
+        if query.is_sliced:
+            # any one shard may hold the whole window
+            low, high = query.low_mark, query.high_mark
+            for queryset in shards:
+                queryset.query.clear_limits()
+                if high is not None:
+                    queryset.query.set_limits(0, high)
+            rows = islice(self._merged(shards), low, high)
+        else:
+            rows = self._merged(shards)
+        # each shard's queryset has already run its prefetches
+        self._result_cache = list(rows)
+        self._prefetch_done = True
+
+    def iterator(self, chunk_size=None):
+        shards = self._shards()
+        if shards is None:
+            return super().iterator(chunk_size)
+        if self.query.is_sliced:
+            return iter(self._chain())
+        # select_related turns into prefetching on a shard, which needs a chunk size
+        chunk_size = chunk_size or 2000
+        return self._merged([queryset.iterator(chunk_size) for queryset in shards])
+
+
+def merge_newest(streams, limit):
+    """The first limit distinct rows of several streams already sorted newest first."""
+    merged = heapq.merge(*streams, reverse=True)
+    return list(islice((row for row, _ in groupby(merged)), limit))
@@ -0,0 +1,213 @@
+"""Time-ordered 64-bit ids: milliseconds since EPOCH, a node id and a sequence.
+
+With SNOWFLAKE_IDS on, models using SnowflakeModel and SnowflakeQuerySet get
+their primary key from here instead of the database sequence, so ordering by
+id is ordering by creation time.
+
+Every process writing at the same time needs its own node id (0-1023), or two
+of them can hand out the same id in the same millisecond. By default each
+process leases a free one from the shared cache on its first id (again after
+a fork) and renews the lease while it keeps writing; settings refuse to start
+without REDIS_URL then, as a per-process cache can't keep leases apart.
+SNOWFLAKE_NODE_ID pins the id instead, for a single writing process.
+
+Snowflake ids pass 2**53, beyond what a JavaScript number holds exactly, so
+with SNOWFLAKE_IDS on, serializers using SnowflakeIdsMixin render the primary
+keys of these models, and foreign keys to them, as strings.
+
+Rows from before the switch keep their sequence ids. Those are far below any
+id generated here and already in insertion order, so no rewrite is needed;
+only don't switch back, as the sequence would then hand out ids below
+everything written in between.
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = NODE_BITS + SEQUENCE_BITS
+# a leased node id is held this long, and renewed once half of it has passed
+NODE_LEASE_SECONDS = 600
+
+
+class SnowflakeGenerator:
+    def __init__(self, node_id):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ImproperlyConfigured(f"SNOWFLAKE_NODE_ID must be between 0 and {MAX_NODE_ID}.")
+        self.node_id = node_id
+        self.last_ms = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            now = time.time_ns() // 1_000_000 - EPOCH_MS
+            if now > self.last_ms:
+                self.last_ms, self.sequence = now, 0
+            elif self.sequence < MAX_SEQUENCE:
+                # same millisecond, or the clock stepped back: keep counting in the last one
+                self.sequence += 1
+            else:
+                # sequence used up, borrow the next millisecond rather than wait for it
+                self.last_ms, self.sequence = self.last_ms + 1, 0
+            return (self.last_ms << TIMESTAMP_SHIFT) | (self.node_id << SEQUENCE_BITS) | self.sequence
+
+
+class Lease(NamedTuple):
+    pid: int
+    node_id: int
+    token: str
+    renewed_at: float
+
+
+_generators = {}
+_generators_lock = threading.Lock()
+_lease = None
+_lease_lock = threading.Lock()
+
+
+def _lease_key(node_id):
+    return f'snowflake:node:{node_id}'
+
+
+def lease_node_id():
+    """Claim a node id no other process holds; returns (node_id, token)."""
+    token = uuid.uuid4().hex
+    start = random.randrange(MAX_NODE_ID + 1)
+    for offset in range(MAX_NODE_ID + 1):
+        node_id = (start + offset) % (MAX_NODE_ID + 1)
+        if cache.add(_lease_key(node_id), token, NODE_LEASE_SECONDS):
+            return node_id, token
+    raise ImproperlyConfigured(f"All {MAX_NODE_ID + 1} snowflake node ids are leased.")
+
+
+def _renewed(lease, now):
+    """The lease renewed, or None if it may have lapsed and been taken meanwhile."""
+    if now - lease.renewed_at > NODE_LEASE_SECONDS * 0.9:
+        return None
+    key = _lease_key(lease.node_id)
+    if cache.get(key) != lease.token or not cache.touch(key, NODE_LEASE_SECONDS):
+        return None
+    return lease._replace(renewed_at=now)
+
+
+def node_id():
+    """This process's node id: SNOWFLAKE_NODE_ID if set, else one leased from the cache."""
+    global _lease
+    if settings.SNOWFLAKE_NODE_ID is not None:
+        return settings.SNOWFLAKE_NODE_ID
+    with _lease_lock:
+        now = time.monotonic()
+        lease = _lease
+        if lease is not None and lease.pid == os.getpid() and now - lease.renewed_at > NODE_LEASE_SECONDS / 2:
+            lease = _renewed(lease, now)
+        # a forked worker must not keep its parent's lease
+        if lease is None or lease.pid != os.getpid():
+            lease = Lease(os.getpid(), *lease_node_id(), now)
+        _lease = lease
+        return lease.node_id
+
+
+def next_id():
+    node = node_id()
+    if node not in _generators:
+        with _generators_lock:
+            _generators.setdefault(node, SnowflakeGenerator(node))
+    return _generators[node].next_id()
+
+
+def id_at(when):
+    """The lowest id generated at or after a datetime, for id range filters."""
+    ms = int(when.timestamp() * 1000) - EPOCH_MS
+    return max(ms, 0) << TIMESTAMP_SHIFT
+
+
+def created_at(snowflake_id):
+    ms = (snowflake_id >> TIMESTAMP_SHIFT) + EPOCH_MS
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+def enabled():
+    return settings.SNOWFLAKE_IDS
+
+
+class SnowflakeQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if enabled():
+            for obj in objs:
+                if obj.pk is None:
+                    obj.pk = next_id()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class SnowflakeModel(models.Model):
+    """Takes its primary key from next_id() when SNOWFLAKE_IDS is on."""
+
+    objects = SnowflakeQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.pk is None and enabled():
+            self.pk = next_id()
+            # the pk is set, but there's no row to UPDATE yet
+            kwargs.setdefault('force_insert', True)
+        super().save(*args, **kwargs)
+
+
+class SnowflakeIdField(serializers.Field):
+    """An id rendered as a string, read back from a string or a number."""
+    default_error_messages = {'invalid': 'A valid id is required.'}
+
+    def to_representation(self, value):
+        return str(value)
+
+    def to_internal_value(self, data):
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+
+
+def render_id(value):
+    """A snowflake model's id as serializers using SnowflakeIdsMixin render it."""
+    return str(value) if enabled() and value is not None else value
+
+
+def _is_snowflake(model):
+    return model is not None and issubclass(model, SnowflakeModel)
+
+
+class SnowflakeIdsMixin:
+    """Serializer mixin rendering snowflake primary and foreign keys as strings, with SNOWFLAKE_IDS on."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not enabled():
+            return fields
+        model = getattr(getattr(self, 'Meta', None), 'model', None)
+        for name, field in fields.items():
+            if isinstance(field, PrimaryKeyRelatedField):
+                related = getattr(field.queryset, 'model', None)
+                if _is_snowflake(related) and field.pk_field is None:
+                    field.pk_field = SnowflakeIdField()
+            elif _is_snowflake(model) and (field.source or name) == model._meta.pk.name:
+                fields[name] = SnowflakeIdField(read_only=True)
+        return fields
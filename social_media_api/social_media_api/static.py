@@ -0,0 +1,47 @@
+"""WhiteNoise that also runs natively under ASGI.
+
+WhiteNoiseMiddleware is sync only, and Django runs a sync-only middleware
+and everything it wraps in a thread under ASGI, so the async views were
+called back through async_to_sync from there. StaticFilesMiddleware is the
+same middleware marked sync and async capable: the async path looks the
+file up (a dict lookup, a stat with autorefresh), opens and reads it in
+threads, and hands every other request straight to the next async handler.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            response = await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+            # Django would read a sync iterator into memory first
+            response.streaming_content = read_file(response.file_to_stream, response.block_size)
+            return response
+        return await self.get_response(request)
+
+
+async def read_file(file, block_size):
+    """Chunks of an open file, read in a thread; nothing for None (HEAD, 304)."""
+    if file is None:
+        return
+    read = sync_to_async(file.read, thread_sensitive=False)
+    while chunk := await read(block_size):
+        yield chunk